@@ -0,0 +1,441 @@
+import base64
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import zlib
+from typing import Iterable, List, Optional, Union
+
+POLITICAS = ("primer_ajuste", "siguiente_ajuste")
+
+
+def clave_contenido(texto: str) -> str:
+    return hashlib.blake2b(texto.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _crudo(datos: Union[str, bytes]) -> bytes:
+    return datos if isinstance(datos, bytes) else datos.encode("utf-8")
+
+
+class _Almacen:
+    instrumentacion = None
+    # comprobar la suma de cada bloque al leerlo; los dañados se devuelven marcados con "danado"
+    verificar = True
+    # los bloques comprimidos solo ahorran espacio si el almacén guarda su longitud real
+    admite_codec = True
+
+    def _contar(self, contador: str, n: int = 1):
+        if self.instrumentacion is not None:
+            self.instrumentacion.contar(contador, n)
+
+    def enlace(self, ref) -> Optional[tuple]:
+        # (siguiente, eof) del bloque, o None si no existe
+        bloque = self.leer_bloque(ref)
+        if bloque is None:
+            return None
+        return bloque.get("siguiente"), bloque.get("eof", False)
+
+
+class AlmacenJSON(_Almacen):
+    tipo = "json"
+    clave_inicial = "ruta_inicial"
+    # los datos binarios se guardan en base64
+    expansion_binaria = 4 / 3
+
+    def __init__(self, path_bloques: str):
+        self.path_bloques = path_bloques
+        os.makedirs(self.path_bloques, exist_ok=True)
+
+    def nueva_referencia(self, nombre: str, indice: int) -> str:
+        # el % se escapa primero para que "a/b" y "a%2Fb" no compartan bloques
+        nombre = nombre.replace("%", "%25").replace("/", "%2F").replace("\\", "%5C")
+        return os.path.join(self.path_bloques, f"{nombre}_bloque{indice}.json")
+
+    def asignar(self, n: int, nombre: str, desde: int = 0) -> List[str]:
+        # la posición en la cadena no determina el nombre (una reparación puede mover la cadena a otros números),
+        # así que se saltan los que ya existen
+        refs = []
+        indice = desde
+        while len(refs) < n:
+            ref = self.nueva_referencia(nombre, indice)
+            if not os.path.exists(ref):
+                refs.append(ref)
+            indice += 1
+        self._contar("llamadas_fs", indice - desde)
+        return refs
+
+    def asignar_contenido(self, claves: List[str]) -> List[str]:
+        return [os.path.join(self.path_bloques, f"dedup_{clave}.json") for clave in claves]
+
+    def escribir_bloque(self, ref: str, datos: Union[str, bytes], siguiente: Optional[str], eof: bool):
+        datos_bloque = {"datos": datos, "siguiente": siguiente, "eof": eof, "crc": zlib.crc32(_crudo(datos))}
+        if isinstance(datos, bytes):
+            datos_bloque["datos"] = base64.b64encode(datos).decode("ascii")
+            datos_bloque["binario"] = True
+        with open(ref, "w", encoding="utf-8") as f:
+            json.dump(datos_bloque, f, ensure_ascii=False, separators=(",", ":"))
+            self._contar("bytes_codificados", f.tell())
+        self._contar("bloques_escritos")
+        self._contar("llamadas_fs")
+
+    def leer_bloque(self, ref: str) -> Optional[dict]:
+        self._contar("llamadas_fs")
+        if not os.path.exists(ref):
+            return None
+        self._contar("llamadas_fs")
+        self._contar("parseos_json")
+        self._contar("bloques_leidos")
+        with open(ref, "r", encoding="utf-8") as f:
+            bloque = json.load(f)
+        if bloque.pop("binario", False):
+            bloque["datos"] = base64.b64decode(bloque["datos"])
+        crc = bloque.pop("crc", None)
+        if self.verificar and crc is not None and zlib.crc32(_crudo(bloque["datos"])) != crc:
+            bloque["danado"] = True
+        return bloque
+
+    def normalizar(self, ref: str) -> str:
+        return os.path.abspath(ref)
+
+    def ocupado(self, ref: str) -> bool:
+        self._contar("llamadas_fs")
+        return os.path.exists(ref)
+
+    def ocupados(self) -> Iterable[str]:
+        self._contar("llamadas_fs")
+        return [os.path.join(self.path_bloques, fname) for fname in os.listdir(self.path_bloques)
+                if fname.endswith(".json")]
+
+    def liberar_bloque(self, ref: str):
+        self._contar("llamadas_fs")
+        try:
+            os.remove(ref)
+        except OSError:
+            pass
+
+    def espacio(self) -> dict:
+        self._contar("llamadas_fs")
+        usados = sum(1 for fname in os.listdir(self.path_bloques) if fname.endswith(".json"))
+        return {
+            "total_clusters": usados,
+            "usados": usados,
+            "libres": 0,
+            "tamano_cluster": None,
+            "huecos_libres": 0,
+            "mayor_hueco": 0,
+        }
+
+    def sincronizar(self):
+        pass
+
+    def cerrar(self):
+        pass
+
+
+class AlmacenEmpaquetado(_Almacen):
+    tipo = "empaquetado"
+    clave_inicial = "cluster_inicial"
+    expansion_binaria = 1.0
+    MAGIA = b"FATPACK2"
+    MAGIA_V1 = b"FATPACK1"
+    # magia, tamaño de cluster en bytes, clusters reservados, cursor de asignación, clusters libres
+    CABECERA = struct.Struct("<8sIIII")
+    TAM_CABECERA = 64
+    # siguiente cluster (-1 = ninguno), bytes útiles, flags, crc32 de los datos (los FATPACK1 no tienen crc)
+    SLOT = struct.Struct("<iHBI")
+    SLOT_V1 = struct.Struct("<iHB")
+    admite_codec = False
+    FLAG_EOF = 1
+    FLAG_OCUPADO = 2
+    FLAG_BINARIO = 4
+
+    def __init__(self, path_datos: str, tamano_cluster: int = 80, clusters_iniciales: int = 1024,
+                 politica: str = "primer_ajuste"):
+        if politica not in POLITICAS:
+            raise ValueError(f"Política de asignación desconocida: '{politica}'.")
+        self.path_datos = path_datos
+        self.path_mapa = os.path.splitext(path_datos)[0] + ".mapa"
+        self.politica = politica
+        clusters_iniciales = max(clusters_iniciales, 1)
+        if not os.path.exists(path_datos) or os.path.getsize(path_datos) == 0:
+            with open(path_datos, "wb") as f:
+                cabecera = self.CABECERA.pack(self.MAGIA, tamano_cluster, clusters_iniciales, 0, clusters_iniciales)
+                f.write(cabecera.ljust(self.TAM_CABECERA, b"\0"))
+                f.truncate(self.TAM_CABECERA + clusters_iniciales * (self.SLOT.size + tamano_cluster))
+            with open(self.path_mapa, "wb") as f:
+                f.truncate(clusters_iniciales)
+        self._f = open(path_datos, "r+b")
+        self._mm = None
+        self._vista = None
+        self._fm = None
+        self._mapa = None
+        self._mapear()
+        self.magia, self.tamano_cluster, _, _, _ = self.CABECERA.unpack_from(self._mm, 0)
+        if self.magia not in (self.MAGIA, self.MAGIA_V1):
+            self.cerrar()
+            raise ValueError(f"'{path_datos}' no es un almacén de bloques empaquetado.")
+        self.con_crc = self.magia == self.MAGIA
+        self.slot = self.SLOT if self.con_crc else self.SLOT_V1
+        self.tamano_slot = self.slot.size + self.tamano_cluster
+        total, _, _ = self._cabecera()
+        if not os.path.exists(self.path_mapa) or os.path.getsize(self.path_mapa) != total:
+            self._reconstruir_mapa(total)
+        self._fm = open(self.path_mapa, "r+b")
+        self._mapa = mmap.mmap(self._fm.fileno(), 0)
+
+    def _mapear(self):
+        if self._vista is not None:
+            self._vista.release()
+        if self._mm is not None:
+            self._mm.close()
+        self._mm = mmap.mmap(self._f.fileno(), 0)
+        self._vista = memoryview(self._mm)
+        if self._mapa is not None:
+            self._mapa.close()
+            self._mapa = mmap.mmap(self._fm.fileno(), 0)
+
+    def _reconstruir_mapa(self, total: int):
+        mapa = bytearray(total)
+        for cluster in range(total):
+            flags = self.slot.unpack_from(self._mm, self._desplazamiento(cluster))[2]
+            if flags & self.FLAG_OCUPADO:
+                mapa[cluster] = 1
+        with open(self.path_mapa, "wb") as f:
+            f.write(mapa)
+        _, cursor, _ = self._cabecera()
+        self._escribir_cabecera(total, cursor, mapa.count(0))
+
+    def _cabecera(self):
+        _, _, total, cursor, libres = self.CABECERA.unpack_from(self._mm, 0)
+        return total, cursor, libres
+
+    def _escribir_cabecera(self, total: int, cursor: int, libres: int):
+        self.CABECERA.pack_into(self._mm, 0, self.magia, self.tamano_cluster, total, cursor, libres)
+
+    def _desplazamiento(self, cluster: int) -> int:
+        return self.TAM_CABECERA + cluster * self.tamano_slot
+
+    def _escribir_slot(self, inicio: int, siguiente: int, longitud: int, flags: int, crc: int = 0):
+        if self.con_crc:
+            self.SLOT.pack_into(self._mm, inicio, siguiente, longitud, flags, crc)
+        else:
+            self.SLOT_V1.pack_into(self._mm, inicio, siguiente, longitud, flags)
+
+    def _asegurar_mapa(self):
+        total, _, _ = self._cabecera()
+        if self._desplazamiento(total) > len(self._mm) or total > len(self._mapa):
+            self._mapear()
+
+    def _crecer(self, total: int) -> int:
+        self._contar("llamadas_fs", 2)
+        nuevo_total = max(total * 2, 1)
+        self._f.truncate(self._desplazamiento(nuevo_total))
+        self._fm.truncate(nuevo_total)
+        self._mapear()
+        _, cursor, libres = self._cabecera()
+        self._escribir_cabecera(nuevo_total, cursor, libres + nuevo_total - total)
+        return nuevo_total
+
+    @property
+    def total_clusters(self) -> int:
+        self._asegurar_mapa()
+        return self._cabecera()[0]
+
+    def _buscar_contiguos(self, n: int, inicio: int) -> Optional[int]:
+        patron = b"\0" * n
+        pos = self._mapa.find(patron, inicio)
+        if pos < 0 and inicio > 0:
+            pos = self._mapa.find(patron, 0)
+        return None if pos < 0 else pos
+
+    def _tomar_dispersos(self, n: int, inicio: int) -> List[int]:
+        clusters = []
+        pos = inicio
+        while len(clusters) < n:
+            pos = self._mapa.find(b"\0", pos)
+            if pos < 0:
+                if inicio == 0:
+                    raise OSError("El mapa de clusters no tiene suficientes clusters libres.")
+                pos = inicio = 0
+                continue
+            self._mapa[pos] = 1
+            clusters.append(pos)
+            pos += 1
+        return clusters
+
+    def asignar(self, n: int, nombre: str = None, desde: int = 0) -> List[int]:
+        if n <= 0:
+            return []
+        self._asegurar_mapa()
+        total, cursor, libres = self._cabecera()
+        while libres < n:
+            total = self._crecer(total)
+            total, cursor, libres = self._cabecera()
+        inicio = cursor if self.politica == "siguiente_ajuste" and cursor < total else 0
+        primero = self._buscar_contiguos(n, inicio)
+        if primero is not None:
+            clusters = list(range(primero, primero + n))
+            self._mapa[primero:primero + n] = b"\1" * n
+        else:
+            clusters = self._tomar_dispersos(n, inicio)
+        for cluster in clusters:
+            self._escribir_slot(self._desplazamiento(cluster), -1, 0, self.FLAG_OCUPADO)
+        self._escribir_cabecera(total, clusters[-1] + 1, libres - n)
+        return clusters
+
+    def nueva_referencia(self, nombre: str, indice: int) -> int:
+        return self.asignar(1, nombre, indice)[0]
+
+    def asignar_contenido(self, claves: List[str]) -> List[int]:
+        return self.asignar(len(claves))
+
+    def escribir_bloque(self, ref: int, datos: Union[str, bytes], siguiente: Optional[int], eof: bool):
+        binario = isinstance(datos, bytes)
+        crudo = datos if binario else datos.encode("utf-8")
+        if len(crudo) > self.tamano_cluster:
+            raise ValueError(f"El bloque ocupa {len(crudo)} bytes y el cluster solo admite {self.tamano_cluster}.")
+        self._asegurar_mapa()
+        inicio = self._desplazamiento(ref)
+        flags = self.FLAG_OCUPADO | (self.FLAG_EOF if eof else 0) | (self.FLAG_BINARIO if binario else 0)
+        self._escribir_slot(inicio, -1 if siguiente is None else siguiente, len(crudo), flags, zlib.crc32(crudo))
+        inicio += self.slot.size
+        self._vista[inicio:inicio + len(crudo)] = crudo
+        self._contar("bloques_escritos")
+        self._contar("bytes_codificados", len(crudo))
+
+    def leer_bloque(self, ref: int) -> Optional[dict]:
+        if not isinstance(ref, int) or ref < 0:
+            return None
+        self._asegurar_mapa()
+        inicio = self._desplazamiento(ref)
+        if inicio + self.tamano_slot > len(self._mm):
+            return None
+        slot = self.slot.unpack_from(self._vista, inicio)
+        siguiente, longitud, flags = slot[:3]
+        if not flags & self.FLAG_OCUPADO:
+            return None
+        self._contar("bloques_leidos")
+        inicio += self.slot.size
+        crudo = self._vista[inicio:inicio + longitud]
+        bloque = {"siguiente": None if siguiente < 0 else siguiente, "eof": bool(flags & self.FLAG_EOF)}
+        if self.verificar and self.con_crc and zlib.crc32(crudo) != slot[3]:
+            bloque["danado"] = True
+        if flags & self.FLAG_BINARIO:
+            bloque["datos"] = bytes(crudo)
+        else:
+            try:
+                bloque["datos"] = str(crudo, "utf-8")
+            except UnicodeDecodeError:
+                bloque["datos"] = str(crudo, "utf-8", "replace")
+                bloque["danado"] = True
+        return bloque
+
+    def enlace(self, ref: int) -> Optional[tuple]:
+        # solo la cabecera del slot: recorrer una cadena no necesita leer ni comprobar los datos
+        if not isinstance(ref, int) or ref < 0:
+            return None
+        self._asegurar_mapa()
+        inicio = self._desplazamiento(ref)
+        if inicio + self.tamano_slot > len(self._mm):
+            return None
+        siguiente, _, flags = self.slot.unpack_from(self._vista, inicio)[:3]
+        if not flags & self.FLAG_OCUPADO:
+            return None
+        return None if siguiente < 0 else siguiente, bool(flags & self.FLAG_EOF)
+
+    def normalizar(self, ref: int) -> int:
+        return ref
+
+    def ocupado(self, ref: int) -> bool:
+        return isinstance(ref, int) and 0 <= ref < self.total_clusters and bool(self._mapa[ref])
+
+    def ocupados(self) -> Iterable[int]:
+        total = self.total_clusters
+        for tramo in re.finditer(b"[^\0]+", self._mapa[:total]):
+            yield from range(tramo.start(), tramo.end())
+
+    def liberar_bloque(self, ref: int):
+        if not isinstance(ref, int) or ref < 0 or ref >= self.total_clusters:
+            return
+        self._escribir_slot(self._desplazamiento(ref), -1, 0, 0)
+        if self._mapa[ref]:
+            self._mapa[ref] = 0
+            total, cursor, libres = self._cabecera()
+            self._escribir_cabecera(total, cursor, libres + 1)
+
+    def espacio(self) -> dict:
+        self._asegurar_mapa()
+        total, _, libres = self._cabecera()
+        huecos = [m.end() - m.start() for m in re.finditer(b"\0+", self._mapa[:total])]
+        return {
+            "total_clusters": total,
+            "usados": total - libres,
+            "libres": libres,
+            "tamano_cluster": self.tamano_cluster,
+            "huecos_libres": len(huecos),
+            "mayor_hueco": max(huecos, default=0),
+        }
+
+    def sincronizar(self):
+        self._contar("llamadas_fs", 2)
+        self._mm.flush()
+        self._mapa.flush()
+
+    def cerrar(self):
+        if self._vista is not None:
+            self._vista.release()
+            self._vista = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._mapa is not None:
+            self._mapa.close()
+            self._mapa = None
+        self._f.close()
+        if self._fm is not None:
+            self._fm.close()
+
+
+def crear_almacen(tipo: str, data_dir: str, politica: str = "primer_ajuste", tamano_cluster: int = 80):
+    if tipo == AlmacenJSON.tipo:
+        return AlmacenJSON(os.path.join(data_dir, "bloques"))
+    if tipo == AlmacenEmpaquetado.tipo:
+        return AlmacenEmpaquetado(os.path.join(data_dir, "bloques.dat"), tamano_cluster, politica=politica)
+    raise ValueError(f"Almacén de bloques desconocido: '{tipo}'.")
+
+
+def leer_volumen(data_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(data_dir, "volumen.json"), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def escribir_volumen(data_dir: str, volumen: dict):
+    path = os.path.join(data_dir, "volumen.json")
+    temporal = path + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(volumen, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporal, path)
+
+
+def tipo_por_entradas(archivos: Iterable[dict]) -> Optional[str]:
+    for archivo in archivos:
+        for clase in (AlmacenJSON, AlmacenEmpaquetado):
+            if clase.clave_inicial in archivo:
+                return clase.tipo
+    return None
+
+
+def detectar_almacen(data_dir: str) -> str:
+    volumen = leer_volumen(data_dir)
+    if volumen is not None:
+        return volumen["almacen"]
+    if os.path.exists(os.path.join(data_dir, "bloques.dat")):
+        return AlmacenEmpaquetado.tipo
+    return AlmacenJSON.tipo
@@ -0,0 +1,3 @@
+from benchmarks.cargas import FASES, ejecutar_configuracion, metadatos
+
+__all__ = ["FASES", "ejecutar_configuracion", "metadatos"]
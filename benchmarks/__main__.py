@@ -0,0 +1,65 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.cargas import ejecutar_configuracion, metadatos
+
+
+def configuraciones(args):
+    for archivos, tamano, tamano_bloque, almacen, modo, codec in itertools.product(
+            args.archivos, args.tamanos, args.bloques, args.almacenes, args.modos, args.codecs):
+        if almacen == "empaquetado" and codec != "ninguno":
+            continue
+        yield {
+            "archivos": archivos,
+            "tamano": tamano,
+            "tamano_bloque": tamano_bloque,
+            "almacen": almacen,
+            "modo": modo,
+            "codec": None if codec == "ninguno" else codec,
+            "lote": args.lote,
+            "muestras": args.muestras,
+            "semilla": args.semilla,
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Mide las operaciones de FATManager con cargas sintéticas.")
+    parser.add_argument("--archivos", type=int, nargs="+", default=[1000], help="Cantidad de archivos creados.")
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[200], help="Caracteres por archivo.")
+    parser.add_argument("--bloques", type=int, nargs="+", default=[20], help="Caracteres por bloque.")
+    parser.add_argument("--almacenes", nargs="+", default=["json"], choices=["json", "empaquetado"])
+    parser.add_argument("--modos", nargs="+", default=["cache"], choices=["simple", "cache", "diario"],
+                        help="simple: sin caché; cache: tabla en memoria; diario: caché y diario de metadatos.")
+    parser.add_argument("--codecs", nargs="+", default=["ninguno"], choices=["ninguno", "zlib", "lzma"],
+                        help="Compresión aplicada a cada bloque.")
+    parser.add_argument("--lote", type=int, default=0, help="Crear los archivos por lotes de este tamaño.")
+    parser.add_argument("--muestras", type=int, default=200, help="Operaciones medidas en cada fase.")
+    parser.add_argument("--semilla", type=int, default=1234)
+    parser.add_argument("--salida", default="-", help="Archivo JSON de resultados ('-' para stdout).")
+    parser.add_argument("--mismo-proceso", action="store_true",
+                        help="No aislar cada configuración en un proceso nuevo (el RSS pico deja de ser comparable).")
+    args = parser.parse_args(argv)
+    resultados = []
+    for config in configuraciones(args):
+        print(f"Ejecutando {config}", file=sys.stderr)
+        if args.mismo_proceso:
+            resultados.append(ejecutar_configuracion(config))
+        else:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                resultados.append(pool.submit(ejecutar_configuracion, config).result())
+    documento = dict(metadatos(), resultados=resultados)
+    if args.salida == "-":
+        json.dump(documento, sys.stdout, indent=2, ensure_ascii=False)
+        print()
+    else:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump(documento, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
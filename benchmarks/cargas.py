@@ -0,0 +1,152 @@
+import os
+import platform
+import random
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Callable, Iterable, Optional
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+from fat_logic import FATManager
+
+FASES = ("crear", "listar", "leer", "leer_rango", "modificar", "anexar", "eliminar", "recuperar", "permisos")
+ALFABETO = string.ascii_letters + string.digits + " \n.,áéíóúñ"
+
+
+def percentil(valores: list, p: float) -> Optional[float]:
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    k = min(len(ordenados) - 1, int(round(p / 100 * (len(ordenados) - 1))))
+    return ordenados[k]
+
+
+def io_proceso() -> dict:
+    # Contadores de E/S del proceso (solo Linux); las escrituras vía mmap no aparecen aquí.
+    try:
+        with open("/proc/self/io", "r", encoding="ascii") as f:
+            return {clave: int(valor) for clave, valor in (linea.split(":") for linea in f)}
+    except (OSError, ValueError):
+        return {}
+
+
+def uso_disco(data_dir: str) -> tuple:
+    archivos = 0
+    total = 0
+    for raiz, _, nombres in os.walk(data_dir):
+        for nombre in nombres:
+            archivos += 1
+            total += os.path.getsize(os.path.join(raiz, nombre))
+    return archivos, total
+
+
+def rss_pico() -> Optional[int]:
+    if resource is None:
+        return None
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico if sys.platform == "darwin" else pico * 1024
+
+
+def commit_actual() -> Optional[str]:
+    try:
+        salida = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        return salida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def medir(fase: str, operaciones: Iterable[Callable[[], object]], data_dir: str) -> dict:
+    io_antes = io_proceso()
+    archivos_antes, bytes_antes = uso_disco(data_dir)
+    latencias = []
+    inicio = time.perf_counter()
+    for operacion in operaciones:
+        t0 = time.perf_counter()
+        operacion()
+        latencias.append(time.perf_counter() - t0)
+    segundos = time.perf_counter() - inicio
+    io_despues = io_proceso()
+    archivos_despues, bytes_despues = uso_disco(data_dir)
+    return {
+        "fase": fase,
+        "operaciones": len(latencias),
+        "segundos": segundos,
+        "ops_por_segundo": len(latencias) / segundos if segundos > 0 else None,
+        "p50_ms": None if not latencias else percentil(latencias, 50) * 1000,
+        "p99_ms": None if not latencias else percentil(latencias, 99) * 1000,
+        "max_ms": None if not latencias else max(latencias) * 1000,
+        "bytes_escritos": io_despues.get("wchar", 0) - io_antes.get("wchar", 0) if io_antes else None,
+        "llamadas_escritura": io_despues.get("syscw", 0) - io_antes.get("syscw", 0) if io_antes else None,
+        "archivos_en_disco": archivos_despues,
+        "delta_archivos": archivos_despues - archivos_antes,
+        "bytes_en_disco": bytes_despues,
+        "delta_bytes_en_disco": bytes_despues - bytes_antes,
+    }
+
+
+def ejecutar_configuracion(config: dict) -> dict:
+    rng = random.Random(config["semilla"])
+    tamano = config["tamano"]
+    base = "".join(rng.choices(ALFABETO, k=max(tamano * 2, 1)))
+    nombres = [f"archivo_{i:06d}" for i in range(config["archivos"])]
+    muestra = rng.sample(nombres, min(config["muestras"], len(nombres)))
+    data_dir = tempfile.mkdtemp(prefix="fat_bench_")
+    fases = []
+    try:
+        fat = FATManager(data_dir, cache=config["modo"] != "simple", diario=config["modo"] == "diario",
+                         almacen=config["almacen"], tamano_bloque=config["tamano_bloque"], codec=config.get("codec"))
+
+        def contenido():
+            inicio = rng.randrange(0, len(base) - tamano + 1)
+            return base[inicio:inicio + tamano]
+
+        if config["lote"]:
+            lotes = [nombres[i:i + config["lote"]] for i in range(0, len(nombres), config["lote"])]
+            crear = (lambda lote=lote: fat.crear_archivos_lote([(n, contenido()) for n in lote], "admin")
+                     for lote in lotes)
+        else:
+            crear = (lambda n=n: fat.crear_archivo(n, contenido(), "admin", []) for n in nombres)
+        fases.append(medir("crear", crear, data_dir))
+        fases.append(medir("listar", [fat.listar_archivos] * max(1, min(len(muestra), 20)), data_dir))
+        fases.append(medir("leer", (lambda n=n: fat.leer_archivo(n, "admin") for n in muestra), data_dir))
+        rangos = [(n, rng.randrange(0, max(tamano, 1)), config["tamano_bloque"] * 2) for n in muestra]
+        fases.append(medir("leer_rango", (lambda r=r: fat.leer_rango(r[0], r[1], r[2], "admin") for r in rangos),
+                           data_dir))
+
+        def modificar(nombre):
+            actual = fat.leer_archivo(nombre, "admin")
+            if actual:
+                pos = rng.randrange(len(actual))
+                actual = actual[:pos] + rng.choice(ALFABETO) + actual[pos + 1:]
+            fat.modificar_archivo(nombre, actual, "admin")
+
+        fases.append(medir("modificar", (lambda n=n: modificar(n) for n in muestra), data_dir))
+        fases.append(medir("anexar", (lambda n=n: fat.anexar(n, "nueva línea\n", "admin") for n in muestra),
+                           data_dir))
+        fases.append(medir("eliminar", (lambda n=n: fat.eliminar_archivo(n) for n in muestra), data_dir))
+        fases.append(medir("recuperar", (lambda n=n: fat.recuperar_archivo(n) for n in muestra), data_dir))
+        fases.append(medir("permisos", (lambda n=n: fat.asignar_permisos(n, "admin", "usuario", ["leer"])
+                                        for n in muestra), data_dir))
+        fat.cerrar()
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+    return {"configuracion": config, "fases": fases, "rss_pico_bytes": rss_pico()}
+
+
+def metadatos() -> dict:
+    return {
+        "version": 1,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "commit": commit_actual(),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+    }
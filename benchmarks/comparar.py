@@ -0,0 +1,49 @@
+import argparse
+import json
+
+
+def _clave(config: dict) -> str:
+    return json.dumps(config, sort_keys=True)
+
+
+def comparar(base: dict, nuevo: dict):
+    fases_base = {_clave(r["configuracion"]): {f["fase"]: f for f in r["fases"]} for r in base["resultados"]}
+    for resultado in nuevo["resultados"]:
+        clave = _clave(resultado["configuracion"])
+        if clave not in fases_base:
+            continue
+        yield resultado["configuracion"], [
+            (fase["fase"], fases_base[clave].get(fase["fase"]), fase) for fase in resultado["fases"]
+        ]
+
+
+def _razon(antes, despues):
+    if not antes or despues is None:
+        return "   n/d"
+    return f"{despues / antes:6.2f}x"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.comparar",
+                                     description="Compara dos resultados de 'python -m benchmarks'.")
+    parser.add_argument("base")
+    parser.add_argument("nuevo")
+    args = parser.parse_args(argv)
+    with open(args.base, "r", encoding="utf-8") as f:
+        base = json.load(f)
+    with open(args.nuevo, "r", encoding="utf-8") as f:
+        nuevo = json.load(f)
+    print(f"base:  {base.get('commit')}\nnuevo: {nuevo.get('commit')}")
+    for config, fases in comparar(base, nuevo):
+        print(f"\n{config}")
+        print(f"{'fase':<12}{'ops/s base':>14}{'ops/s nuevo':>14}{'':>9}{'p99 base':>12}{'p99 nuevo':>12}")
+        for nombre, antes, despues in fases:
+            if antes is None:
+                continue
+            print(f"{nombre:<12}{antes['ops_por_segundo'] or 0:>14.1f}{despues['ops_por_segundo'] or 0:>14.1f}"
+                  f"{_razon(antes['ops_por_segundo'], despues['ops_por_segundo']):>9}"
+                  f"{antes['p99_ms'] or 0:>12.3f}{despues['p99_ms'] or 0:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class CerrojoFAT:
+    # Lectores/escritor dentro del proceso (con preferencia al escritor) y, si hay fcntl,
+    # un flock compartido/exclusivo sobre path_bloqueo para coordinarse con otros procesos.
+    # El escritor que espera el flock exclusivo tiene tomado el "turno": mientras tanto los lectores
+    # nuevos de los demás procesos no se suman al flock compartido, así que el escritor no se queda sin paso.
+    def __init__(self, path_bloqueo: Optional[str] = None):
+        self._cond = threading.Condition()
+        self._lectores = 0
+        self._escritor = None
+        self._escritores_esperando = 0
+        self._local = threading.local()
+        self._cond_archivo = threading.Condition()
+        self._lectores_archivo = 0
+        self._f = None
+        self._turno = None
+        if path_bloqueo is not None and fcntl is not None:
+            self._f = open(path_bloqueo, "a+")
+            self._turno = open(path_bloqueo + ".turno", "a+")
+
+    def _profundidad(self) -> int:
+        return getattr(self._local, "profundidad", 0)
+
+    def _flock(self, modo):
+        if self._f is not None:
+            fcntl.flock(self._f.fileno(), modo)
+
+    def _escritor_externo(self) -> bool:
+        if self._turno is None:
+            return False
+        try:
+            fcntl.flock(self._turno.fileno(), fcntl.LOCK_SH | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(self._turno.fileno(), fcntl.LOCK_UN)
+        return False
+
+    def _tomar_compartido(self):
+        if self._f is None:
+            return
+        fcntl.flock(self._turno.fileno(), fcntl.LOCK_SH)
+        try:
+            self._flock(fcntl.LOCK_SH)
+        finally:
+            fcntl.flock(self._turno.fileno(), fcntl.LOCK_UN)
+
+    def _tomar_exclusivo(self):
+        if self._f is None:
+            return
+        fcntl.flock(self._turno.fileno(), fcntl.LOCK_EX)
+        try:
+            self._flock(fcntl.LOCK_EX)
+        finally:
+            fcntl.flock(self._turno.fileno(), fcntl.LOCK_UN)
+
+    @contextmanager
+    def lectura(self):
+        if self._profundidad():
+            self._local.profundidad += 1
+            try:
+                yield
+            finally:
+                self._local.profundidad -= 1
+            return
+        with self._cond:
+            while self._escritor is not None or self._escritores_esperando:
+                self._cond.wait()
+            self._lectores += 1
+        try:
+            with self._cond_archivo:
+                # con un escritor de otro proceso en cola se espera a que los lectores de este suelten el flock
+                while self._lectores_archivo and self._escritor_externo():
+                    self._cond_archivo.wait(0.01)
+                if self._lectores_archivo == 0:
+                    self._tomar_compartido()
+                self._lectores_archivo += 1
+            self._local.profundidad = 1
+            self._local.modo = "lectura"
+            try:
+                yield
+            finally:
+                self._local.profundidad = 0
+                with self._cond_archivo:
+                    self._lectores_archivo -= 1
+                    if self._lectores_archivo == 0:
+                        self._flock(fcntl.LOCK_UN if fcntl else None)
+                        self._cond_archivo.notify_all()
+        finally:
+            with self._cond:
+                self._lectores -= 1
+                if self._lectores == 0:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def escritura(self):
+        if self._profundidad():
+            if self._local.modo != "escritura":
+                raise RuntimeError("No se puede pasar de un bloqueo de lectura a uno de escritura.")
+            self._local.profundidad += 1
+            try:
+                yield
+            finally:
+                self._local.profundidad -= 1
+            return
+        with self._cond:
+            self._escritores_esperando += 1
+            try:
+                while self._escritor is not None or self._lectores:
+                    self._cond.wait()
+            finally:
+                self._escritores_esperando -= 1
+            self._escritor = threading.get_ident()
+        try:
+            self._tomar_exclusivo()
+            self._local.profundidad = 1
+            self._local.modo = "escritura"
+            try:
+                yield
+            finally:
+                self._local.profundidad = 0
+                self._flock(fcntl.LOCK_UN if fcntl else None)
+        finally:
+            with self._cond:
+                self._escritor = None
+                self._cond.notify_all()
+
+    def cerrar(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        if self._turno is not None:
+            self._turno.close()
+            self._turno = None
+
+
+def con_lectura(metodo):
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with self.cerrojo.lectura():
+            return metodo(self, *args, **kwargs)
+    return envoltura
+
+
+def con_escritura(metodo):
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with self.cerrojo.escritura():
+            return metodo(self, *args, **kwargs)
+    return envoltura
@@ -0,0 +1,37 @@
+import lzma
+import zlib
+from typing import Optional, Union
+
+# Cada bloque comprimido lleva un byte con su codec, así se puede leer sin consultar la FAT.
+_FILTROS_LZMA = [{"id": lzma.FILTER_LZMA2, "preset": 6}]
+CODECS = {
+    "zlib": (b"z", lambda crudo: zlib.compress(crudo, 6), zlib.decompress),
+    "lzma": (b"x", lambda crudo: lzma.compress(crudo, format=lzma.FORMAT_RAW, filters=_FILTROS_LZMA),
+             lambda datos: lzma.decompress(datos, format=lzma.FORMAT_RAW, filters=_FILTROS_LZMA)),
+}
+_POR_MARCA = {marca: descomprimir for marca, _, descomprimir in CODECS.values()}
+
+
+def validar_codec(codec: Optional[str]):
+    if codec is not None and codec not in CODECS:
+        raise ValueError(f"Codec desconocido: '{codec}'.")
+
+
+def comprimir(texto: str, codec: Optional[str], expansion: float = 1.0) -> Union[str, bytes]:
+    if codec is None or not texto:
+        return texto
+    marca, compresor, _ = CODECS[codec]
+    crudo = texto.encode("utf-8")
+    comprimido = marca + compresor(crudo)
+    # si no compensa (contando lo que crece al guardarlo) se guarda el texto tal cual, que siempre cabe en el cluster
+    return comprimido if len(comprimido) * expansion < len(crudo) else texto
+
+
+def descomprimir(datos: Union[str, bytes]) -> str:
+    if isinstance(datos, str):
+        return datos
+    return _POR_MARCA[datos[:1]](datos[1:]).decode("utf-8")
+
+
+def tamano_fisico(datos: Union[str, bytes]) -> int:
+    return len(datos) if isinstance(datos, bytes) else len(datos.encode("utf-8"))
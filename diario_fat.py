@@ -0,0 +1,139 @@
+import json
+import os
+import threading
+import time
+from typing import Iterable, List, Optional
+
+
+def _lineas_diario(path: str):
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        yield from f
+
+
+def reproducir_diario(path: str, archivos: List[dict], pendientes: Iterable[str] = ()) -> List[dict]:
+    tabla = {a["nombre"]: a for a in archivos}
+    aplicadas = 0
+    for lineas in (_lineas_diario(path), pendientes):
+        for linea in lineas:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                registro = json.loads(linea)
+            except json.JSONDecodeError:
+                # registro a medio escribir por una caída: se descarta
+                continue
+            if registro.get("op") == "poner":
+                tabla[registro["archivo"]["nombre"]] = registro["archivo"]
+            elif registro.get("op") == "quitar":
+                tabla.pop(registro["nombre"], None)
+            aplicadas += 1
+    if not aplicadas:
+        return archivos
+    return list(tabla.values())
+
+
+class DiarioFAT:
+    # Confirmación en grupo: se hace fsync cada `lote` operaciones o cuando la más antigua sin confirmar
+    # cumple `intervalo` segundos (lo vigila un hilo). Con `compartido` (otros procesos usan el mismo
+    # directorio) cada operación se escribe en el archivo antes de soltar el cerrojo y solo se agrupa el fsync.
+    instrumentacion = None
+
+    def __init__(self, path: str, lote: int = 1, intervalo: Optional[float] = None, fsync: bool = True,
+                 compartido: bool = False):
+        self.path = path
+        self.lote = max(lote, 1)
+        self.intervalo = intervalo
+        self.fsync = fsync
+        self.compartido = compartido
+        self._mutex = threading.RLock()
+        self._pendientes = []
+        self._ops_pendientes = 0
+        self._primer_pendiente = None
+        self._f = open(path, "a", encoding="utf-8")
+        self.operaciones = 0
+        self.confirmaciones = 0
+        self._detener = threading.Event()
+        self._vigilante = None
+        if intervalo is not None and self.lote > 1:
+            self._vigilante = threading.Thread(target=self._vigilar, name="diario-fat", daemon=True)
+            self._vigilante.start()
+
+    @property
+    def pendientes(self) -> int:
+        return self._ops_pendientes
+
+    def _vigilar(self):
+        while not self._detener.wait(self.intervalo / 2):
+            with self._mutex:
+                if (self._primer_pendiente is not None
+                        and time.monotonic() - self._primer_pendiente >= self.intervalo):
+                    self.confirmar()
+
+    def registrar(self, cambiados: Iterable[dict] = (), quitados: Iterable[str] = ()) -> bool:
+        with self._mutex:
+            for archivo in cambiados:
+                self._pendientes.append(json.dumps({"op": "poner", "archivo": archivo}, ensure_ascii=False))
+            for nombre in quitados:
+                self._pendientes.append(json.dumps({"op": "quitar", "nombre": nombre}, ensure_ascii=False))
+            self._ops_pendientes += 1
+            self.operaciones += 1
+            if self._primer_pendiente is None:
+                self._primer_pendiente = time.monotonic()
+            vencido = self.intervalo is not None and time.monotonic() - self._primer_pendiente >= self.intervalo
+            if self._ops_pendientes >= self.lote or vencido:
+                self.confirmar()
+                return True
+            if self.compartido:
+                self._escribir()
+                return True
+            return False
+
+    def _escribir(self):
+        if not self._pendientes:
+            return
+        texto = "\n".join(self._pendientes) + "\n"
+        self._f.write(texto)
+        self._f.flush()
+        if self.instrumentacion is not None:
+            self.instrumentacion.contar("bytes_codificados", len(texto.encode("utf-8")))
+            self.instrumentacion.contar("llamadas_fs")
+        self._pendientes = []
+
+    def confirmar(self):
+        with self._mutex:
+            if not self._ops_pendientes:
+                return
+            self._escribir()
+            if self.fsync:
+                os.fsync(self._f.fileno())
+                if self.instrumentacion is not None:
+                    self.instrumentacion.contar("llamadas_fs")
+            self._ops_pendientes = 0
+            self._primer_pendiente = None
+            self.confirmaciones += 1
+
+    def reproducir(self, archivos: List[dict]) -> List[dict]:
+        with self._mutex:
+            return reproducir_diario(self.path, archivos, list(self._pendientes))
+
+    def vaciar(self):
+        with self._mutex:
+            self._pendientes = []
+            self._ops_pendientes = 0
+            self._primer_pendiente = None
+            self._f.truncate(0)
+            self._f.flush()
+            if self.fsync:
+                os.fsync(self._f.fileno())
+
+    def cerrar(self):
+        self._detener.set()
+        if self._vigilante is not None:
+            self._vigilante.join()
+        with self._mutex:
+            if not self._f.closed:
+                self.confirmar()
+                self._f.close()
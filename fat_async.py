@@ -0,0 +1,69 @@
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import Optional
+
+from fat_logic import FATManager
+
+
+def _asincrono(nombre: str):
+    async def metodo(self, *args, **kwargs):
+        return await self._ejecutar(getattr(self.fat, nombre), *args, **kwargs)
+    metodo.__name__ = nombre
+    return metodo
+
+
+class FATManagerAsync:
+    def __init__(self, fat: Optional[FATManager] = None, executor: Optional[Executor] = None, **opciones):
+        self.fat = fat if fat is not None else FATManager(**opciones)
+        self._executor = executor
+
+    async def _ejecutar(self, funcion, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(funcion, *args, **kwargs))
+
+    listar_archivos = _asincrono("listar_archivos")
+    obtener_datos_papelera = _asincrono("obtener_datos_papelera")
+    obtener_metadatos = _asincrono("obtener_metadatos")
+    buscar = _asincrono("buscar")
+    buscar_texto = _asincrono("buscar_texto")
+    leer_archivo = _asincrono("leer_archivo")
+    leer_rango = _asincrono("leer_rango")
+    crear_archivo = _asincrono("crear_archivo")
+    crear_archivos_lote = _asincrono("crear_archivos_lote")
+    exportar_lote = _asincrono("exportar_lote")
+    modificar_archivo = _asincrono("modificar_archivo")
+    anexar = _asincrono("anexar")
+    eliminar_archivo = _asincrono("eliminar_archivo")
+    recuperar_archivo = _asincrono("recuperar_archivo")
+    purgar_archivo = _asincrono("purgar_archivo")
+    vaciar_papelera = _asincrono("vaciar_papelera")
+    compactar = _asincrono("compactar")
+    reconstruir_indice_texto = _asincrono("reconstruir_indice_texto")
+    verificar = _asincrono("verificar")
+    asignar_permisos = _asincrono("asignar_permisos")
+    espacio = _asincrono("espacio")
+    checkpoint = _asincrono("checkpoint")
+
+    async def leer_bloques(self, nombre: str, rol: str, tamano: Optional[int] = None):
+        lector = await self._ejecutar(self.fat.abrir_lectura, nombre, rol)
+        try:
+            while True:
+                trozo = await self._ejecutar(lector.read, tamano or self.fat.tamano_bloque)
+                if not trozo:
+                    return
+                yield trozo
+        finally:
+            lector.close()
+
+    def estadisticas(self) -> dict:
+        return self.fat.estadisticas()
+
+    async def cerrar(self):
+        await self._ejecutar(self.fat.cerrar)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.cerrar()
@@ -0,0 +1,130 @@
+import argparse
+import os
+import sys
+from compresion import CODECS
+from fat_logic import PROBLEMAS, FATManager, migrar_almacen
+
+
+def recorrer_directorio(origen: str):
+    for raiz, dirs, archivos in os.walk(origen):
+        dirs.sort()
+        for fname in sorted(archivos):
+            ruta = os.path.join(raiz, fname)
+            nombre = os.path.relpath(ruta, origen).replace(os.sep, "/")
+            try:
+                with open(ruta, "r", encoding="utf-8", newline="") as f:
+                    yield nombre, f.read()
+            except (UnicodeDecodeError, OSError) as e:
+                print(f"Se omite '{ruta}': {e}", file=sys.stderr)
+
+
+def comando_migrar(args):
+    total = migrar_almacen(args.data_dir, args.destino)
+    print(f"{total} archivo(s) migrado(s) al almacén '{args.destino}'.")
+
+
+def comando_importar(args):
+    with FATManager(args.data_dir, cache=True, diario=args.diario, deduplicar=args.deduplicar,
+                    tamano_bloque=args.tamano_bloque, codec=args.codec) as fat:
+        lote = []
+        total = 0
+        for nombre, contenido in recorrer_directorio(args.origen):
+            lote.append((args.prefijo + nombre, contenido))
+            if len(lote) >= args.lote:
+                total += len(fat.crear_archivos_lote(lote, args.owner, args.permisos, args.hilos))
+                lote = []
+        if lote:
+            total += len(fat.crear_archivos_lote(lote, args.owner, args.permisos, args.hilos))
+    print(f"{total} archivo(s) importado(s) desde '{args.origen}'.")
+
+
+def comando_exportar(args):
+    with FATManager(args.data_dir, cache=True) as fat:
+        rutas = fat.exportar_lote(args.destino, args.rol, args.nombres or None, args.hilos)
+    print(f"{len(rutas)} archivo(s) exportado(s) a '{args.destino}'.")
+
+
+def comando_mantenimiento(args):
+    with FATManager(args.data_dir, cache=True) as fat:
+        purgados = []
+        if args.dias is not None or args.cuota is not None or args.vaciar:
+            purgados = fat.vaciar_papelera(args.dias, args.cuota)
+        resumen = fat.compactar() if args.compactar else None
+    print(f"{len(purgados)} archivo(s) purgado(s) de la papelera.")
+    if resumen is not None:
+        print(f"{resumen['compactados']} archivo(s) compactado(s), {resumen['bloques_movidos']} bloque(s) movido(s).")
+
+
+def comando_buscar(args):
+    with FATManager(args.data_dir, cache=True, indexar_texto=True) as fat:
+        if args.reconstruir:
+            fat.reconstruir_indice_texto()
+        nombres = fat.buscar_texto(args.consulta, args.rol, args.limite)
+    for nombre in nombres:
+        print(nombre)
+
+
+def comando_verificar(args):
+    with FATManager(args.data_dir) as fat:
+        informe = fat.verificar(rapido=args.rapido, reparar=args.reparar, procesos=args.procesos)
+    print(f"{informe['archivos']} archivo(s) revisado(s) en modo {informe['modo']}.")
+    for problema in PROBLEMAS:
+        for detalle in informe[problema]:
+            print(f"{problema}: {detalle}")
+    if args.reparar:
+        print(f"{len(informe['reparados'])} archivo(s) reparado(s), {informe['liberados']} bloque(s) liberado(s).")
+    return 0 if informe["correcto"] or args.reparar else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Herramientas de línea de comandos del sistema FAT.")
+    parser.add_argument("--data-dir", default="data", help="Directorio de datos del sistema FAT.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_migrar = sub.add_parser("migrar", help="Convierte los bloques al otro formato de almacenamiento.")
+    p_migrar.add_argument("destino", choices=["json", "empaquetado"])
+    p_migrar.set_defaults(func=comando_migrar)
+    p_importar = sub.add_parser("importar", help="Importa un árbol de directorios del sistema anfitrión.")
+    p_importar.add_argument("origen")
+    p_importar.add_argument("--owner", default="admin")
+    p_importar.add_argument("--permisos", nargs="*", default=[], help="Permisos del owner sobre cada archivo.")
+    p_importar.add_argument("--prefijo", default="", help="Prefijo añadido al nombre de cada archivo importado.")
+    p_importar.add_argument("--lote", type=int, default=1000, help="Archivos por confirmación de metadatos.")
+    p_importar.add_argument("--hilos", type=int, default=None)
+    p_importar.add_argument("--diario", action="store_true", help="Registra los metadatos en el diario.")
+    p_importar.add_argument("--deduplicar", action="store_true",
+                            help="Comparte los bloques de contenido idéntico entre archivos.")
+    p_importar.add_argument("--tamano-bloque", type=int, default=None,
+                            help="Caracteres por bloque (por omisión, el que admite el almacén).")
+    p_importar.add_argument("--codec", choices=sorted(CODECS), default=None,
+                            help="Compresión de cada bloque (solo con el almacén json).")
+    p_importar.set_defaults(func=comando_importar)
+    p_exportar = sub.add_parser("exportar", help="Exporta archivos al sistema anfitrión.")
+    p_exportar.add_argument("destino")
+    p_exportar.add_argument("nombres", nargs="*", help="Archivos a exportar (por defecto, todos los legibles).")
+    p_exportar.add_argument("--rol", default="admin")
+    p_exportar.add_argument("--hilos", type=int, default=None)
+    p_exportar.set_defaults(func=comando_exportar)
+    p_mant = sub.add_parser("mantenimiento", help="Vacía la papelera y compacta las cadenas fragmentadas.")
+    p_mant.add_argument("--dias", type=float, default=None, help="Purga lo que lleve más de N días en la papelera.")
+    p_mant.add_argument("--cuota", type=int, default=None, help="Tamaño máximo total de la papelera.")
+    p_mant.add_argument("--vaciar", action="store_true", help="Purga toda la papelera.")
+    p_mant.add_argument("--compactar", action="store_true", help="Reescribe las cadenas fragmentadas contiguas.")
+    p_mant.set_defaults(func=comando_mantenimiento)
+    p_buscar = sub.add_parser("buscar", help="Busca archivos por su contenido con el índice de texto.")
+    p_buscar.add_argument("consulta", help='Palabras, "frases exactas" y prefijos terminados en *.')
+    p_buscar.add_argument("--rol", default="admin")
+    p_buscar.add_argument("--limite", type=int, default=None)
+    p_buscar.add_argument("--reconstruir", action="store_true", help="Reconstruye el índice antes de buscar.")
+    p_buscar.set_defaults(func=comando_buscar)
+    p_verificar = sub.add_parser("verificar", help="Comprueba las cadenas de bloques y sus sumas de comprobación.")
+    p_verificar.add_argument("--rapido", action="store_true", help="Revisa solo los metadatos, sin leer bloques.")
+    p_verificar.add_argument("--reparar", action="store_true",
+                             help="Corta cadenas rotas, separa bloques cruzados y libera huérfanos.")
+    p_verificar.add_argument("--procesos", type=int, default=None)
+    p_verificar.set_defaults(func=comando_verificar)
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
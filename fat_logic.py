@@ -1,156 +1,1238 @@
+import bisect
 import json
 import os
-from datetime import datetime
-from typing import List, Optional
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+from almacen_bloques import (clave_contenido, crear_almacen, detectar_almacen, escribir_volumen, leer_volumen,
+                             tipo_por_entradas)
+from bloqueos import CerrojoFAT, con_escritura, con_lectura
+from compresion import comprimir, descomprimir, tamano_fisico, validar_codec
+from diario_fat import DiarioFAT, reproducir_diario
+from indice_texto import IndiceTexto
+from indices_fat import IndicesFAT, en_rango, fecha_cambio, normalizar_rango
+from instrumentacion import Instrumentacion, instrumentado
+from verificacion import agrupar_cruces, recorrer_cadenas, revisar_archivo
+
+TAMANO_BLOQUE = 20
+# índices de bloques por archivo que se guardan en memoria, con o sin caché de la FAT
+MAX_INDICES_BLOQUES = 4096
+PROBLEMAS = ("enlaces_rotos", "ciclos", "cruzados", "huerfanos", "tamanos_incorrectos", "sumas_incorrectas")
+
+
+class LectorArchivo:
+    def __init__(self, fat, refs: list, tamano: int, tamano_bloque: int, hashes: Optional[list] = None,
+                 nombre: Optional[str] = None, version: Optional[tuple] = None):
+        self._fat = fat
+        self._refs = refs
+        self._hashes = hashes
+        self._nombre = nombre
+        self._version = version
+        self._tamano_bloque = tamano_bloque
+        self.tamano = tamano
+        self._pos = 0
+        self.cerrado = False
+
+    def read(self, n: int = -1) -> str:
+        if self.cerrado:
+            raise ValueError("El lector está cerrado.")
+        if n is None or n < 0:
+            n = self.tamano - self._pos
+        with self._fat.instrumentacion.operacion("lector_read"), self._fat.cerrojo.lectura():
+            self._comprobar_vigente()
+            texto = self._fat._leer_desde_refs(self._refs, self._pos, n, self._tamano_bloque, self._hashes,
+                                               self.tamano)
+        self._pos += len(texto)
+        return texto
+
+    def _comprobar_vigente(self):
+        # las refs guardadas al abrir pueden haberse liberado y reutilizado por otro archivo
+        if self._nombre is None:
+            return
+        archivo = self._fat._localizar(self._nombre)[1]
+        if archivo is None or archivo.get("papelera", False):
+            raise FileNotFoundError(f"El archivo '{self._nombre}' ya no existe o está en la papelera.")
+        if self._fat._version_contenido(archivo) != self._version:
+            raise OSError(f"El archivo '{self._nombre}' cambió desde que se abrió el lector.")
+        if self._fat._ref_inicial(archivo) != self._refs[0]:
+            # misma versión del contenido en otros clusters (compactado)
+            self._refs = self._fat._indice_bloques(archivo)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.tamano
+        elif whence != os.SEEK_SET:
+            raise ValueError(f"Valor de whence no válido: {whence}")
+        if offset < 0:
+            raise ValueError("No se puede posicionar antes del inicio del archivo.")
+        self._pos = offset
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def __iter__(self):
+        while True:
+            bloque = self.read(self._tamano_bloque - self._pos % self._tamano_bloque)
+            if not bloque:
+                return
+            yield bloque
+
+    def close(self):
+        self.cerrado = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 class FATManager:
-    def __init__(self, data_dir="data"):
+    def __init__(self, data_dir="data", cache=False, almacen=None, politica="primer_ajuste",
+                 diario=False, lote_diario=1, intervalo_diario=None, fsync_diario=True, checkpoint_cada=1000,
+                 tamano_bloque=None, perfilar=False, bloqueo_procesos=True, deduplicar=False,
+                 cache_bloques=256, codec=None, indexar_texto=False, verificar_bloques=True,
+                 verificar_al_abrir=False):
         self.data_dir = data_dir
+        self.instrumentacion = Instrumentacion(perfilar)
+        # los contadores de dedup se derivan de la tabla: sin caché habría que recalcularlos en cada escritura
+        self.cache = cache or diario or deduplicar
+        self._tabla = None
+        self._firma = None
+        self._indice = {}
+        self._papelera = set()
+        self._indices = None
+        self.cache_aciertos = 0
+        self.cache_fallos = 0
+        self._indices_bloques = OrderedDict()
+        self._mutex_cache = threading.Lock()
+        self.deduplicar = deduplicar
+        self._dedup = None
+        self.cache_bloques = cache_bloques
+        self._cache_bloques = OrderedDict()
+        self._mutex_bloques = threading.Lock()
+        self.bloques_aciertos = 0
+        self.bloques_fallos = 0
+        self._ultimo_compactado = None
+        self._mantenimiento = None
+        self._detener_mantenimiento = threading.Event()
+        self.error_mantenimiento = None
         self.path_fat = os.path.join(self.data_dir, "fat_table.json")
+        self.path_diario = os.path.join(self.data_dir, "fat_table.diario")
+        self.checkpoint_cada = checkpoint_cada
+        self.codec = codec
         self.path_bloques = os.path.join(self.data_dir, "bloques")
         os.makedirs(self.path_bloques, exist_ok=True)
         os.makedirs(self.data_dir, exist_ok=True)
+        self.cerrojo = CerrojoFAT(os.path.join(self.data_dir, "fat.lock") if bloqueo_procesos else None)
         if not os.path.exists(self.path_fat):
             with open(self.path_fat, "w", encoding="utf-8") as f:
                 json.dump([], f, indent=4, ensure_ascii=False)
+        self.diario = None
+        try:
+            with self.cerrojo.escritura():
+                _completar_migracion(self.data_dir)
+                tipo = self._tipo_volumen(almacen)
+        except ValueError:
+            self.cerrojo.cerrar()
+            raise
+        if tamano_bloque is not None and tamano_bloque <= 0:
+            self.cerrojo.cerrar()
+            raise ValueError("El tamaño de bloque debe ser positivo.")
+        self.almacen = crear_almacen(tipo, self.data_dir, politica, 4 * (tamano_bloque or TAMANO_BLOQUE))
+        try:
+            self._validar_formato(None, codec)
+        except ValueError:
+            self.almacen.cerrar()
+            raise
+        # sin tamaño explícito se usa el que admiten los clusters del almacén; uno explícito se comprueba al escribir
+        capacidad = getattr(self.almacen, "tamano_cluster", None)
+        if tamano_bloque is None:
+            tamano_bloque = capacidad // 4 if capacidad else TAMANO_BLOQUE
+        self.tamano_bloque = tamano_bloque
+        self.almacen.instrumentacion = self.instrumentacion
+        self.almacen.verificar = verificar_bloques
+        if diario:
+            self.diario = DiarioFAT(self.path_diario, lote_diario, intervalo_diario, fsync_diario,
+                                    compartido=bloqueo_procesos)
+            self.diario.instrumentacion = self.instrumentacion
+            self._leer_tabla_fat()
+        self.indice_texto = None
+        if indexar_texto or os.path.exists(os.path.join(self.data_dir, "indice_texto.json")):
+            self.indice_texto = IndiceTexto(self.data_dir, checkpoint_cada)
+            if not self.indice_texto.existia:
+                self.reconstruir_indice_texto()
+        self.verificacion = self.verificar(rapido=True) if verificar_al_abrir else None
 
-    def _leer_tabla_fat(self):
+    def _tipo_volumen(self, almacen: Optional[str]) -> str:
+        # el tipo queda registrado en volumen.json; los volúmenes anteriores lo deducen de sus entradas
+        volumen = leer_volumen(self.data_dir)
+        por_entradas = tipo_por_entradas(self._cargar_tabla())
+        registrado = volumen["almacen"] if volumen is not None else por_entradas
+        if registrado is None and os.path.exists(os.path.join(self.data_dir, "bloques.dat")):
+            registrado = detectar_almacen(self.data_dir)
+        if por_entradas is not None and por_entradas != registrado:
+            raise ValueError(f"Las entradas de la FAT usan el almacén '{por_entradas}' pero el volumen registra "
+                             f"'{registrado}'.")
+        if registrado is None:
+            registrado = almacen or detectar_almacen(self.data_dir)
+        elif almacen is not None and almacen != registrado:
+            raise ValueError(f"El volumen usa el almacén '{registrado}', no '{almacen}'; conviértelo con "
+                             f"migrar_almacen.")
+        if volumen is None:
+            escribir_volumen(self.data_dir, {"almacen": registrado})
+        return registrado
+
+    def _validar_formato(self, tamano_bloque: Optional[int], codec: Optional[str]):
+        validar_codec(codec)
+        if codec is not None and not self.almacen.admite_codec:
+            raise ValueError(f"El almacén '{self.almacen.tipo}' guarda cada bloque en un cluster completo: "
+                             f"el codec '{codec}' no ahorraría espacio.")
+        if tamano_bloque is None:
+            return
+        if tamano_bloque <= 0:
+            raise ValueError("El tamaño de bloque debe ser positivo.")
+        capacidad = getattr(self.almacen, "tamano_cluster", None)
+        if capacidad is not None and capacidad < 4 * tamano_bloque:
+            raise ValueError(f"Los clusters de {capacidad} bytes no admiten bloques de {tamano_bloque} caracteres.")
+
+    def cerrar(self):
+        self.detener_mantenimiento()
+        with self.cerrojo.escritura():
+            if self.diario is not None:
+                self.diario.cerrar()
+            self.almacen.cerrar()
+        self.cerrojo.cerrar()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.cerrar()
+
+    def estadisticas(self) -> dict:
+        estadisticas = self.instrumentacion.instantanea()
+        estadisticas["cache"] = self.estadisticas_cache()
+        if self.diario is not None:
+            estadisticas["diario"] = {
+                "operaciones": self.diario.operaciones,
+                "confirmaciones": self.diario.confirmaciones,
+                "pendientes": self.diario.pendientes,
+            }
+        return estadisticas
+
+    def agregar_hook(self, hook):
+        self.instrumentacion.agregar_hook(hook)
+
+    def quitar_hook(self, hook):
+        self.instrumentacion.quitar_hook(hook)
+
+    def volcar_perfiles(self, directorio: str) -> list:
+        return self.instrumentacion.volcar_perfiles(directorio)
+
+    def _firma_tabla(self):
+        self.instrumentacion.contar("llamadas_fs", 2)
+        st = os.stat(self.path_fat)
+        try:
+            sd = os.stat(self.path_diario)
+        except FileNotFoundError:
+            return (st.st_mtime_ns, st.st_size, 0, 0)
+        return (st.st_mtime_ns, st.st_size, sd.st_mtime_ns, sd.st_size)
+
+    def _cargar_cache(self, archivos, firma):
+        self._tabla = archivos
+        self._firma = firma
+        self._indice = {a["nombre"]: a for a in archivos}
+        self._papelera = {a["nombre"] for a in archivos if a.get("papelera", False)}
+        self._indices = None
+
+    def _aplicar_cambios(self, cambiados: Iterable[dict], quitados: Iterable[str]):
+        for archivo in cambiados:
+            self._indice[archivo["nombre"]] = archivo
+            if archivo.get("papelera", False):
+                self._papelera.add(archivo["nombre"])
+            else:
+                self._papelera.discard(archivo["nombre"])
+            if self._indices is not None:
+                self._indices.actualizar(archivo)
+        for nombre in quitados:
+            self._indice.pop(nombre, None)
+            self._papelera.discard(nombre)
+            if self._indices is not None:
+                self._indices.quitar(nombre)
+
+    def _indices_busqueda(self) -> IndicesFAT:
+        with self._mutex_cache:
+            if self._indices is None:
+                self._indices = IndicesFAT(self._indice.values())
+            return self._indices
+
+    def invalidar_cache(self):
+        self._tabla = None
+        self._firma = None
+        self._indice = {}
+        self._papelera = set()
+        self._indices = None
+        self._indices_bloques.clear()
+
+    def estadisticas_cache(self) -> dict:
+        return {
+            "activa": self.cache,
+            "aciertos": self.cache_aciertos,
+            "fallos": self.cache_fallos,
+            "entradas": len(self._indice),
+            "en_papelera": len(self._papelera),
+            "bloques_en_cache": len(self._cache_bloques),
+            "bloques_aciertos": self.bloques_aciertos,
+            "bloques_fallos": self.bloques_fallos,
+        }
+
+    def _cargar_tabla(self):
+        self.instrumentacion.contar("llamadas_fs", 2)
+        self.instrumentacion.contar("parseos_json")
         with open(self.path_fat, "r", encoding="utf-8") as f:
-            return json.load(f)
+            archivos = json.load(f)
+        if self.diario is not None:
+            return self.diario.reproducir(archivos)
+        return reproducir_diario(self.path_diario, archivos)
+
+    def _leer_tabla_fat(self):
+        if not self.cache:
+            return self._cargar_tabla()
+        with self._mutex_cache:
+            firma = self._firma_tabla()
+            if self._tabla is not None and firma == self._firma:
+                self.cache_aciertos += 1
+                return self._tabla
+            self.cache_fallos += 1
+            self._indices_bloques.clear()
+            archivos = self._cargar_tabla()
+            self._cargar_cache(archivos, firma)
+            return archivos
 
-    def _guardar_tabla_fat(self, archivos):
-        with open(self.path_fat, "w", encoding="utf-8") as f:
+    def _escribir_tabla(self, archivos):
+        temporal = self.path_fat + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
             json.dump(archivos, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+            self.instrumentacion.contar("bytes_codificados", f.tell())
+        self.instrumentacion.contar("llamadas_fs", 3)
+        os.replace(temporal, self.path_fat)
+        if self.diario is not None:
+            self.diario.vaciar()
+        elif os.path.exists(self.path_diario):
+            with open(self.path_diario, "w", encoding="utf-8"):
+                pass
+
+    def _guardar_tabla_fat(self, archivos, cambiados=(), quitados=()):
+        if self.diario is None or (not cambiados and not quitados):
+            self._escribir_tabla(archivos)
+            if self.cache and self._tabla is archivos and (cambiados or quitados):
+                self._aplicar_cambios(cambiados, quitados)
+                self._firma = self._firma_tabla()
+            elif self.cache:
+                self._cargar_cache(archivos, self._firma_tabla())
+            return
+        self._aplicar_cambios(cambiados, quitados)
+        if self.diario.registrar(cambiados, quitados):
+            self._firma = self._firma_tabla()
+        if self.diario.operaciones % self.checkpoint_cada == 0:
+            self.checkpoint()
+
+    @instrumentado
+    @con_escritura
+    def checkpoint(self):
+        archivos = self._leer_tabla_fat()
+        self._escribir_tabla(archivos)
+        self._firma = self._firma_tabla()
 
+    def _localizar(self, nombre: str):
+        archivos = self._leer_tabla_fat()
+        if self.cache:
+            return archivos, self._indice.get(nombre)
+        return archivos, next((a for a in archivos if a["nombre"] == nombre), None)
+
+    @instrumentado
+    @con_lectura
     def listar_archivos(self) -> List[str]:
         archivos = self._leer_tabla_fat()
+        if self.cache:
+            return [n for n in self._indice if n not in self._papelera]
         return [a["nombre"] for a in archivos if not a.get("papelera", False)]
 
+    @instrumentado
+    @con_lectura
     def obtener_datos_papelera(self):
         archivos = self._leer_tabla_fat()
-        return [a for a in archivos if a.get("papelera", False)]
+        return [self._copia_entrada(a) for a in archivos if a.get("papelera", False)]
 
+    @instrumentado
+    @con_lectura
     def obtener_metadatos(self, nombre: str) -> Optional[dict]:
+        archivo = self._localizar(nombre)[1]
+        return None if archivo is None else self._copia_entrada(archivo)
+
+    def _copia_entrada(self, archivo: dict) -> dict:
+        # con caché las entradas son las de la tabla en memoria: quien las reciba no debe poder alterarla
+        if not self.cache:
+            return archivo
+        copia = dict(archivo)
+        copia["permisos"] = {rol: list(permisos) for rol, permisos in archivo.get("permisos", {}).items()}
+        for clave in ("bloques", "hashes"):
+            if clave in copia:
+                copia[clave] = list(copia[clave])
+        return copia
+
+    @instrumentado
+    @con_lectura
+    def buscar(self, owner: Optional[str] = None, rol_legible: Optional[str] = None,
+               creado_entre: Optional[tuple] = None, modificado_entre: Optional[tuple] = None,
+               tamano_min: Optional[int] = None, tamano_max: Optional[int] = None,
+               en_papelera: Optional[bool] = False, prefijo: Optional[str] = None,
+               pagina: int = 0, por_pagina: Optional[int] = 100) -> dict:
+        creado_entre = normalizar_rango(creado_entre)
+        modificado_entre = normalizar_rango(modificado_entre)
+
+        def coincide(archivo):
+            tamano = archivo.get("tamaño", 0)
+            return ((en_papelera is None or archivo.get("papelera", False) == en_papelera)
+                    and (owner is None or archivo.get("owner") == owner)
+                    and (rol_legible is None or self._puede_leer(archivo, rol_legible))
+                    and (not prefijo or archivo["nombre"].startswith(prefijo))
+                    and (creado_entre is None or en_rango(archivo.get("fecha_creacion") or "", *creado_entre))
+                    and (modificado_entre is None or en_rango(fecha_cambio(archivo), *modificado_entre))
+                    and (tamano_min is None or tamano >= tamano_min)
+                    and (tamano_max is None or tamano <= tamano_max))
+
         archivos = self._leer_tabla_fat()
-        return next((a for a in archivos if a["nombre"] == nombre), None)
+        if not self.cache:
+            resultados = sorted((a for a in archivos if coincide(a)), key=lambda a: a["nombre"])
+        else:
+            # se recorre solo el índice más selectivo y el resto de criterios se comprueba sobre cada candidato
+            indices = self._indices_busqueda()
+            candidatos = [indices.nombres]
+            if owner is not None:
+                candidatos.append(indices.por_owner.get(owner, ()))
+            if rol_legible is not None:
+                candidatos.append(indices.legibles.get(rol_legible, ()))
+            if en_papelera:
+                candidatos.append(self._papelera)
+            if prefijo:
+                candidatos.append(indices.con_prefijo(prefijo))
+            if creado_entre is not None:
+                candidatos.append(indices.creados_entre(*creado_entre))
+            if modificado_entre is not None:
+                candidatos.append(indices.cambiados_entre(*modificado_entre))
+            if tamano_min is not None or tamano_max is not None:
+                candidatos.append(indices.con_tamano(tamano_min, tamano_max))
+            nombres = sorted(n for n in min(candidatos, key=len) if coincide(self._indice[n]))
+            resultados = [self._indice[n] for n in nombres]
+        total = len(resultados)
+        if por_pagina is not None:
+            resultados = resultados[pagina * por_pagina:(pagina + 1) * por_pagina]
+        return {"total": total, "pagina": pagina, "por_pagina": por_pagina,
+                "archivos": [self._copia_entrada(a) for a in resultados]}
+
+    def _ref_inicial(self, archivo: dict):
+        return archivo.get(self.almacen.clave_inicial)
+
+    def _recorrer_cadena(self, ruta_inicial, estricto: bool = False):
+        visitados = set()
+        ruta_actual = ruta_inicial
+        while ruta_actual is not None and ruta_actual not in visitados:
+            bloque = self.almacen.leer_bloque(ruta_actual)
+            if bloque is None:
+                break
+            visitados.add(ruta_actual)
+            yield ruta_actual, bloque
+            if bloque.get("eof", False):
+                return
+            ruta_actual = bloque.get("siguiente")
+        # sin estricto se devuelve lo alcanzable (para liberar o reescribir cadenas dañadas)
+        if estricto:
+            raise OSError(f"La cadena de bloques que empieza en {ruta_inicial} está rota en {ruta_actual}.")
+
+    def _refs_cadena(self, ruta_inicial, limite: Optional[int] = None) -> list:
+        # sigue solo los enlaces, sin decodificar datos; con limite se detiene tras esa cantidad de refs
+        refs = []
+        visitados = set()
+        ref = ruta_inicial
+        while ref is not None and ref not in visitados and len(refs) != limite:
+            enlace = self.almacen.enlace(ref)
+            if enlace is None:
+                break
+            visitados.add(ref)
+            refs.append(ref)
+            ref = None if enlace[1] else enlace[0]
+        return refs
+
+    def _indice_bloques(self, archivo: dict, limite: Optional[int] = None) -> list:
+        if "hashes" in archivo:
+            return archivo["bloques"]
+        clave = (self._ref_inicial(archivo),) + self._version_contenido(archivo)
+        guardado = self._indices_bloques.get(archivo["nombre"])
+        if guardado is not None and guardado[0] == clave:
+            return guardado[1]
+        refs = self._refs_cadena(clave[0], limite)
+        if limite is None or len(refs) < limite:
+            self._recordar_indice(archivo, refs)
+        return refs
+
+    def _version_contenido(self, archivo: dict) -> tuple:
+        return (archivo.get("version"), archivo.get("tamaño"), archivo.get("fecha_creacion"),
+                archivo.get("fecha_modificacion"))
+
+    def _recordar_indice(self, archivo: dict, refs: list):
+        # la clave incluye la versión del contenido, así que un índice guardado nunca se usa con otra cadena
+        clave = (self._ref_inicial(archivo),) + self._version_contenido(archivo)
+        with self._mutex_bloques:
+            self._indices_bloques[archivo["nombre"]] = (clave, refs)
+            self._indices_bloques.move_to_end(archivo["nombre"])
+            if len(self._indices_bloques) > MAX_INDICES_BLOQUES:
+                self._indices_bloques.popitem(last=False)
+
+    def _tamano_bloque(self, archivo: dict) -> int:
+        return archivo.get("tamano_bloque", TAMANO_BLOQUE)
 
-    def separar_por_bloque(self, contenido: str, nombre: str) -> str:
-        tamano_bloque = 20
-        bloques = [contenido[i:i + tamano_bloque] for i in range(0, len(contenido), tamano_bloque)]
-        rutas = []
+    def _dividir(self, contenido: str, tamano_bloque: Optional[int] = None) -> List[str]:
+        tamano_bloque = tamano_bloque or self.tamano_bloque
+        return [contenido[i:i + tamano_bloque] for i in range(0, len(contenido), tamano_bloque)] or [""]
+
+    def _codificar(self, bloques: List[str], codec: Optional[str]) -> list:
+        return [comprimir(bloque, codec, self.almacen.expansion_binaria) for bloque in bloques]
+
+    def _escribir_cadena(self, bloques: List[str], nombre: str, refs_previas: Optional[list] = None,
+                         desde: int = 0) -> list:
+        refs_previas = refs_previas or []
+        refs = refs_previas[:len(bloques)]
+        refs += self.almacen.asignar(len(bloques) - len(refs), nombre, desde + len(refs))
+        for ref in refs_previas[len(bloques):]:
+            self.almacen.liberar_bloque(ref)
         for i, bloque in enumerate(bloques):
             eof = (i == len(bloques) - 1)
-            siguiente = None
-            if not eof:
-                siguiente = os.path.join(self.path_bloques, f"{nombre}_bloque{i+1}.json")
-            datos_bloque = {"datos": bloque, "siguiente": siguiente, "eof": eof}
-            ruta_archivo = os.path.join(self.path_bloques, f"{nombre}_bloque{i}.json")
-            with open(ruta_archivo, "w", encoding="utf-8") as f:
-                json.dump(datos_bloque, f, indent=3, ensure_ascii=False)
-            rutas.append(ruta_archivo)
-        if not rutas:
-            ruta_vacia = os.path.join(self.path_bloques, f"{nombre}_bloque0.json")
-            datos_bloque = {"datos": "", "siguiente": None, "eof": True}
-            with open(ruta_vacia, "w", encoding="utf-8") as f:
-                json.dump(datos_bloque, f, indent=3, ensure_ascii=False)
-            return ruta_vacia
-        return rutas[0]
-
-    def crear_archivo(self, nombre: str, contenido: str, owner: str, permisos_por_rol: List[str]):
-        ruta_inicial = self.separar_por_bloque(contenido, nombre)
+            siguiente = None if eof else refs[i + 1]
+            if i < len(refs_previas):
+                previo = self.almacen.leer_bloque(refs[i])
+                if (previo is not None and previo.get("datos") == bloque and not previo.get("danado")
+                        and previo.get("siguiente") == siguiente and previo.get("eof", False) == eof):
+                    continue
+            self.almacen.escribir_bloque(refs[i], bloque, siguiente, eof)
+        self.almacen.sincronizar()
+        return refs
+
+    def separar_por_bloque(self, contenido: str, nombre: str, refs_previas: Optional[list] = None,
+                           tamano_bloque: Optional[int] = None, codec: Optional[str] = None):
+        cargas = self._codificar(self._dividir(contenido, tamano_bloque), codec)
+        return self._escribir_cadena(cargas, nombre, refs_previas)[0]
+
+    def _conteo_dedup(self, archivos: list) -> Dict[str, list]:
+        # hash -> [ref, referencias]; se deriva de las entradas de la FAT (papelera incluida)
+        if self._dedup is None or self._dedup[0] is not archivos:
+            conteo = {}
+            for archivo in archivos:
+                for ref, clave in zip(archivo.get("bloques", ()), archivo.get("hashes", ())):
+                    conteo.setdefault(clave, [ref, 0])[1] += 1
+            self._dedup = (archivos, conteo)
+        return self._dedup[1]
+
+    def _escribir_dedup(self, archivos: list, bloques: List[str], hashes_previos: Iterable[str] = (),
+                        codec: Optional[str] = None) -> Tuple[list, list, int]:
+        conteo = self._conteo_dedup(archivos)
+        hashes = [clave_contenido(bloque) for bloque in bloques]
+        cargas = self._codificar(bloques, codec)
+        nuevos = {}
+        for clave, carga in zip(hashes, cargas):
+            if clave not in conteo:
+                nuevos.setdefault(clave, carga)
+        for ref, (clave, carga) in zip(self.almacen.asignar_contenido(list(nuevos)), nuevos.items()):
+            self.almacen.escribir_bloque(ref, carga, None, True)
+            conteo[clave] = [ref, 0]
+        for clave in hashes:
+            conteo[clave][1] += 1
+        self._soltar_dedup(archivos, hashes_previos)
+        self.almacen.sincronizar()
+        return [conteo[clave][0] for clave in hashes], hashes, sum(map(tamano_fisico, cargas))
+
+    def _soltar_dedup(self, archivos: list, hashes: Iterable[str]):
+        conteo = self._conteo_dedup(archivos)
+        for clave in hashes:
+            entrada = conteo.get(clave)
+            if entrada is None:
+                continue
+            entrada[1] -= 1
+            if entrada[1] <= 0:
+                self.almacen.liberar_bloque(entrada[0])
+                del conteo[clave]
+
+    def _fijar_dedup(self, archivo: dict, refs: list, hashes: list):
+        archivo[self.almacen.clave_inicial] = refs[0]
+        archivo["bloques"] = refs
+        archivo["hashes"] = hashes
+
+    def _leer_datos(self, ref, clave: Optional[str] = None) -> Optional[str]:
+        if clave is not None:
+            with self._mutex_bloques:
+                datos = self._cache_bloques.get(clave)
+                if datos is not None:
+                    self._cache_bloques.move_to_end(clave)
+                    self.bloques_aciertos += 1
+                    return datos
+                self.bloques_fallos += 1
+        bloque = self.almacen.leer_bloque(ref)
+        if bloque is None:
+            return None
+        datos = self._datos_bloque(ref, bloque)
+        if clave is not None and clave_contenido(datos) != clave:
+            # la ref ya no guarda ese contenido (se liberó y reutilizó): no debe entrar en la caché
+            raise OSError(f"El bloque {ref} no contiene el contenido esperado ({clave}).")
+        if clave is not None and self.cache_bloques:
+            with self._mutex_bloques:
+                self._cache_bloques[clave] = datos
+                if len(self._cache_bloques) > self.cache_bloques:
+                    self._cache_bloques.popitem(last=False)
+        return datos
+
+    def _datos_bloque(self, ref, bloque: dict) -> str:
+        if bloque.get("danado"):
+            raise OSError(f"El bloque {ref} está dañado: su suma de comprobación no coincide.")
+        return descomprimir(bloque.get("datos", ""))
+
+    @instrumentado
+    @con_escritura
+    def crear_archivo(self, nombre: str, contenido: str, owner: str, permisos_por_rol: List[str],
+                      tamano_bloque: Optional[int] = None, codec: Optional[str] = None):
+        tamano_bloque = tamano_bloque or self.tamano_bloque
+        codec = codec or self.codec
+        self._validar_formato(tamano_bloque, codec)
+        archivos, existente = self._localizar(nombre)
+        if existente is not None:
+            raise ValueError(f"Ya existe un archivo con el nombre '{nombre}'.")
+        bloques = self._dividir(contenido, tamano_bloque)
+        if self.deduplicar:
+            refs, hashes, fisico = self._escribir_dedup(archivos, bloques, codec=codec)
+        else:
+            cargas = self._codificar(bloques, codec)
+            refs, hashes, fisico = self._escribir_cadena(cargas, nombre), None, sum(map(tamano_fisico, cargas))
+        nuevo = self._nueva_entrada(nombre, refs[0], len(contenido), owner, permisos_por_rol,
+                                    tamano_bloque, codec, fisico)
+        if hashes is not None:
+            self._fijar_dedup(nuevo, refs, hashes)
+        archivos.append(nuevo)
+        self._guardar_tabla_fat(archivos, [nuevo])
+        if self.indice_texto is not None:
+            self.indice_texto.poner(nombre, contenido)
+
+    def _nueva_entrada(self, nombre: str, ruta_inicial, tamano: int, owner: str, permisos_por_rol: List[str],
+                       tamano_bloque: Optional[int] = None, codec: Optional[str] = None, fisico: int = 0) -> dict:
         ahora = datetime.now().isoformat(sep=" ", timespec="seconds")
-        nuevo = {
+        return {
             "nombre": nombre,
-            "ruta_inicial": ruta_inicial,
+            self.almacen.clave_inicial: ruta_inicial,
             "papelera": False,
-            "tamaño": len(contenido),
+            "tamaño": tamano,
+            "tamaño_fisico": fisico,
+            "version": os.urandom(8).hex(),
+            "tamano_bloque": tamano_bloque or self.tamano_bloque,
+            "codec": codec,
             "fecha_creacion": ahora,
             "fecha_modificacion": None,
             "fecha_eliminacion": None,
             "owner": owner,
             "permisos": {owner: permisos_por_rol.copy()}
         }
+
+    def _volcar_bloques(self, refs: list, bloques: List[str], codec: Optional[str] = None) -> int:
+        fisico = 0
+        for i, bloque in enumerate(bloques):
+            eof = (i == len(bloques) - 1)
+            carga = comprimir(bloque, codec, self.almacen.expansion_binaria)
+            fisico += tamano_fisico(carga)
+            self.almacen.escribir_bloque(refs[i], carga, None if eof else refs[i + 1], eof)
+        return fisico
+
+    def _volcar_lote(self, lote: List[Tuple[str, str]], hilos: Optional[int]) -> List[Tuple[list, None, int]]:
+        trabajos = []
+        for nombre, contenido in lote:
+            bloques = self._dividir(contenido)
+            trabajos.append((self.almacen.asignar(len(bloques), nombre), bloques))
+        try:
+            with ThreadPoolExecutor(max_workers=hilos) as pool:
+                resultados = [pool.submit(self._volcar_bloques, refs, bloques, self.codec)
+                              for refs, bloques in trabajos]
+                fisicos = [resultado.result() for resultado in resultados]
+        except Exception:
+            for refs, _ in trabajos:
+                for ref in refs:
+                    self.almacen.liberar_bloque(ref)
+            raise
+        finally:
+            self.almacen.sincronizar()
+        return [(refs, None, fisico) for (refs, _), fisico in zip(trabajos, fisicos)]
+
+    @instrumentado
+    @con_escritura
+    def crear_archivos_lote(self, lote: Iterable[Tuple[str, str]], owner: str,
+                            permisos_por_rol: Optional[List[str]] = None, hilos: Optional[int] = None) -> List[str]:
+        self._validar_formato(self.tamano_bloque, self.codec)
+        lote = list(lote)
         archivos = self._leer_tabla_fat()
-        if any(a["nombre"] == nombre for a in archivos):
-            raise ValueError(f"Ya existe un archivo con el nombre '{nombre}'.")
-        archivos.append(nuevo)
-        self._guardar_tabla_fat(archivos)
+        existentes = {a["nombre"] for a in archivos}
+        nombres = set()
+        for nombre, _ in lote:
+            if nombre in existentes or nombre in nombres:
+                raise ValueError(f"Ya existe un archivo con el nombre '{nombre}'.")
+            nombres.add(nombre)
+        if self.deduplicar:
+            escritos = [self._escribir_dedup(archivos, self._dividir(contenido), codec=self.codec)
+                        for _, contenido in lote]
+        else:
+            escritos = self._volcar_lote(lote, hilos)
+        nuevos = []
+        for (nombre, contenido), (refs, hashes, fisico) in zip(lote, escritos):
+            nuevo = self._nueva_entrada(nombre, refs[0], len(contenido), owner, permisos_por_rol or [],
+                                        codec=self.codec, fisico=fisico)
+            if hashes is not None:
+                self._fijar_dedup(nuevo, refs, hashes)
+            nuevos.append(nuevo)
+        archivos.extend(nuevos)
+        self._guardar_tabla_fat(archivos, nuevos)
+        if self.indice_texto is not None:
+            self.indice_texto.poner_lote(lote)
+        return [a["nombre"] for a in nuevos]
 
-    def _concatenar_bloques(self, ruta_inicial: str) -> str:
-        contenido_total = ""
-        ruta_actual = ruta_inicial
-        while ruta_actual:
-            if not os.path.exists(ruta_actual):
-                break
-            with open(ruta_actual, "r", encoding="utf-8") as bloque_file:
-                bloque = json.load(bloque_file)
-                contenido_total += bloque.get("datos", "")
-                ruta_actual = bloque.get("siguiente")
-                if bloque.get("eof", False):
-                    break
-        return contenido_total
+    def _iterar_bloques(self, archivo: dict):
+        if "hashes" in archivo:
+            for ref, clave in zip(archivo["bloques"], archivo["hashes"]):
+                datos = self._leer_datos(ref, clave)
+                if datos is None:
+                    raise OSError(f"Falta el bloque {ref} del archivo '{archivo['nombre']}'.")
+                yield datos
+            return
+        for ref, bloque in self._recorrer_cadena(self._ref_inicial(archivo), estricto=True):
+            yield self._datos_bloque(ref, bloque)
 
-    def leer_archivo(self, nombre: str, rol: str) -> str:
-        archivo = self.obtener_metadatos(nombre)
+    def _concatenar_bloques(self, archivo: dict) -> str:
+        return "".join(self._iterar_bloques(archivo))
+
+    def _leer_desde_refs(self, refs: list, offset: int, length: int, tamano_bloque: int,
+                         hashes: Optional[list] = None, tamano: Optional[int] = None) -> str:
+        if length <= 0 or offset < 0:
+            return ""
+        primero = offset // tamano_bloque
+        ultimo = (offset + length - 1) // tamano_bloque
+        partes = []
+        for i in range(primero, min(ultimo + 1, len(refs))):
+            datos = self._leer_datos(refs[i], hashes[i] if hashes else None)
+            if datos is None:
+                raise OSError(f"Falta el bloque {refs[i]}.")
+            partes.append(datos)
+        inicio = offset - primero * tamano_bloque
+        texto = "".join(partes)[inicio:inicio + length]
+        if tamano is not None and len(texto) < min(length, tamano - offset):
+            raise OSError("La cadena de bloques es más corta que el tamaño registrado del archivo.")
+        return texto
+
+    def _archivo_legible(self, nombre: str, rol: str) -> dict:
+        archivo = self._localizar(nombre)[1]
         if not archivo or archivo.get("papelera", False):
             raise FileNotFoundError(f"El archivo '{nombre}' no existe o está en la papelera.")
-        permisos = archivo.get("permisos", {})
-        if rol != archivo.get("owner") and "leer" not in permisos.get(rol, []):
+        if not self._puede_leer(archivo, rol):
             raise PermissionError("No tienes permiso para leer este archivo.")
-        contenido = self._concatenar_bloques(archivo["ruta_inicial"])
+        return archivo
+
+    def _puede_leer(self, archivo: dict, rol: str) -> bool:
+        return rol == archivo.get("owner") or "leer" in archivo.get("permisos", {}).get(rol, [])
+
+    @instrumentado
+    @con_lectura
+    def buscar_texto(self, consulta: str, rol: str, limite: Optional[int] = None) -> List[str]:
+        if self.indice_texto is None:
+            raise RuntimeError("El índice de texto no está activo: crea el FATManager con indexar_texto=True.")
+        puntuaciones = self.indice_texto.buscar(consulta)
+        archivos = self._leer_tabla_fat()
+        tabla = self._indice if self.cache else {a["nombre"]: a for a in archivos}
+        # los archivos en la papelera siguen indexados para no releerlos al recuperarlos
+        encontrados = [nombre for nombre in puntuaciones
+                       if nombre in tabla and not tabla[nombre].get("papelera", False)
+                       and self._puede_leer(tabla[nombre], rol)]
+        encontrados.sort(key=lambda nombre: (-puntuaciones[nombre], nombre))
+        return encontrados[:limite]
+
+    @instrumentado
+    @con_escritura
+    def reconstruir_indice_texto(self) -> int:
+        archivos = self._leer_tabla_fat()
+        if self.indice_texto is None:
+            self.indice_texto = IndiceTexto(self.data_dir, self.checkpoint_cada)
+
+        def documentos():
+            for archivo in archivos:
+                try:
+                    yield archivo["nombre"], self._concatenar_bloques(archivo)
+                except OSError:
+                    continue
+
+        self.indice_texto.reconstruir(documentos())
+        return len(archivos)
+
+    @instrumentado
+    @con_lectura
+    def exportar_lote(self, destino: str, rol: str, nombres: Optional[Iterable[str]] = None,
+                      hilos: Optional[int] = None) -> Dict[str, str]:
+        if nombres is None:
+            seleccion = [a for a in self._leer_tabla_fat()
+                         if not a.get("papelera", False) and self._puede_leer(a, rol)]
+        else:
+            seleccion = [self._archivo_legible(nombre, rol) for nombre in nombres]
+        raiz = os.path.abspath(destino)
+        rutas = {}
+        for archivo in seleccion:
+            ruta = os.path.abspath(os.path.join(raiz, *archivo["nombre"].split("/")))
+            if os.path.commonpath([raiz, ruta]) != raiz or ruta == raiz:
+                raise ValueError(f"El nombre '{archivo['nombre']}' no se puede exportar fuera de '{destino}'.")
+            rutas[archivo["nombre"]] = ruta
+
+        def exportar(archivo):
+            ruta = rutas[archivo["nombre"]]
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            with open(ruta, "w", encoding="utf-8", newline="") as f:
+                f.writelines(self._iterar_bloques(archivo))
+
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            for resultado in [pool.submit(exportar, archivo) for archivo in seleccion]:
+                resultado.result()
+        return rutas
+
+    @instrumentado
+    @con_lectura
+    def leer_archivo(self, nombre: str, rol: str) -> str:
+        archivo = self._archivo_legible(nombre, rol)
+        contenido = self._concatenar_bloques(archivo)
+        if len(contenido) != archivo.get("tamaño", len(contenido)):
+            raise OSError(f"El archivo '{nombre}' no tiene el tamaño registrado en la FAT.")
         return contenido
 
+    @instrumentado
+    @con_lectura
+    def abrir_lectura(self, nombre: str, rol: str) -> LectorArchivo:
+        archivo = self._archivo_legible(nombre, rol)
+        return LectorArchivo(self, self._indice_bloques(archivo), archivo.get("tamaño", 0),
+                             self._tamano_bloque(archivo), archivo.get("hashes"), nombre,
+                             self._version_contenido(archivo))
+
+    @instrumentado
+    @con_lectura
+    def leer_rango(self, nombre: str, offset: int, length: int, rol: str) -> str:
+        archivo = self._archivo_legible(nombre, rol)
+        tamano_bloque = self._tamano_bloque(archivo)
+        # sin índice guardado basta recorrer la cadena hasta el último bloque pedido
+        refs = self._indice_bloques(archivo, max(offset + length - 1, 0) // tamano_bloque + 1)
+        return self._leer_desde_refs(refs, offset, length, tamano_bloque, archivo.get("hashes"),
+                                     archivo.get("tamaño", 0))
+
+    @instrumentado
+    @con_escritura
     def eliminar_archivo(self, nombre: str):
-        archivos = self._leer_tabla_fat()
-        encontrado = False
-        for a in archivos:
-            if a["nombre"] == nombre and not a.get("papelera", False):
-                a["papelera"] = True
-                a["fecha_eliminacion"] = datetime.now().isoformat(sep=" ", timespec="seconds")
-                encontrado = True
-        if not encontrado:
+        archivos, archivo = self._localizar(nombre)
+        if archivo is None or archivo.get("papelera", False):
             raise FileNotFoundError(f"Archivo '{nombre}' no encontrado o ya en papelera.")
-        self._guardar_tabla_fat(archivos)
+        archivo["papelera"] = True
+        archivo["fecha_eliminacion"] = datetime.now().isoformat(sep=" ", timespec="seconds")
+        self._guardar_tabla_fat(archivos, [archivo])
 
+    @instrumentado
+    @con_escritura
     def recuperar_archivo(self, nombre: str):
-        archivos = self._leer_tabla_fat()
-        encontrado = False
-        for a in archivos:
-            if a["nombre"] == nombre and a.get("papelera", False):
-                a["papelera"] = False
-                a["fecha_eliminacion"] = None
-                encontrado = True
-        if not encontrado:
+        archivos, archivo = self._localizar(nombre)
+        if archivo is None or not archivo.get("papelera", False):
             raise FileNotFoundError(f"Archivo '{nombre}' no encontrado en la papelera.")
-        self._guardar_tabla_fat(archivos)
+        archivo["papelera"] = False
+        archivo["fecha_eliminacion"] = None
+        self._guardar_tabla_fat(archivos, [archivo])
 
-    def _eliminar_bloques_fisicos(self, nombre: str):
-        prefijo = f"{nombre}_bloque"
-        for fname in os.listdir(self.path_bloques):
-            if fname.startswith(prefijo):
-                try:
-                    os.remove(os.path.join(self.path_bloques, fname))
-                except Exception:
-                    pass
+    def _eliminar_bloques_fisicos(self, ruta_inicial):
+        for ref in self._refs_cadena(ruta_inicial):
+            self.almacen.liberar_bloque(ref)
+        self.almacen.sincronizar()
 
-    def modificar_archivo(self, nombre: str, nuevo_contenido: str, rol: str):
+    @instrumentado
+    @con_escritura
+    def purgar_archivo(self, nombre: str):
+        archivos, archivo = self._localizar(nombre)
+        if archivo is None or not archivo.get("papelera", False):
+            raise FileNotFoundError(f"Archivo '{nombre}' no encontrado en la papelera.")
+        if "hashes" in archivo:
+            self._soltar_dedup(archivos, archivo["hashes"])
+            self.almacen.sincronizar()
+        else:
+            self._eliminar_bloques_fisicos(self._ref_inicial(archivo))
+        self._indices_bloques.pop(nombre, None)
+        archivos.remove(archivo)
+        self._guardar_tabla_fat(archivos, quitados=[nombre])
+        if self.indice_texto is not None:
+            self.indice_texto.quitar(nombre)
+
+    @instrumentado
+    @con_lectura
+    def espacio(self) -> dict:
+        info = self.almacen.espacio()
         archivos = self._leer_tabla_fat()
-        archivo = next((a for a in archivos if a["nombre"] == nombre and not a.get("papelera", False)), None)
-        if not archivo:
+        archivos_fragmentados = 0
+        fragmentos = 0
+        if self.almacen.tipo == "empaquetado":
+            for archivo in archivos:
+                if "hashes" in archivo:
+                    continue
+                saltos = self._saltos(self._refs_cadena(self._ref_inicial(archivo)))
+                if saltos:
+                    archivos_fragmentados += 1
+                    fragmentos += saltos
+        info["archivos_fragmentados"] = archivos_fragmentados
+        info["fragmentos"] = fragmentos
+        conteo = self._conteo_dedup(archivos)
+        referenciados = sum(entrada[1] for entrada in conteo.values())
+        info["bloques_dedup_referenciados"] = referenciados
+        info["bloques_dedup_unicos"] = len(conteo)
+        info["ratio_dedup"] = referenciados / len(conteo) if conteo else None
+        info["tamaño_logico"] = sum(a.get("tamaño", 0) for a in archivos)
+        info["tamaño_fisico"] = sum(a.get("tamaño_fisico", a.get("tamaño", 0)) for a in archivos)
+        return info
+
+    def _saltos(self, refs: list) -> int:
+        return sum(1 for actual, siguiente in zip(refs, refs[1:]) if siguiente != actual + 1)
+
+    @instrumentado
+    def vaciar_papelera(self, dias: Optional[float] = None, cuota_tamano: Optional[int] = None,
+                        max_archivos: Optional[int] = None) -> List[str]:
+        papelera = sorted(self.obtener_datos_papelera(), key=lambda a: a.get("fecha_eliminacion") or "")
+        limite = None if dias is None else datetime.now() - timedelta(days=dias)
+        restante = sum(a.get("tamaño", 0) for a in papelera)
+        candidatos = []
+        for archivo in papelera:
+            eliminado = archivo.get("fecha_eliminacion")
+            vencido = limite is not None and eliminado is not None and datetime.fromisoformat(eliminado) <= limite
+            excede = cuota_tamano is not None and restante > cuota_tamano
+            if vencido or excede or (dias is None and cuota_tamano is None):
+                candidatos.append(archivo["nombre"])
+                restante -= archivo.get("tamaño", 0)
+        purgados = []
+        for nombre in candidatos[:max_archivos]:
+            try:
+                self.purgar_archivo(nombre)
+            except FileNotFoundError:
+                continue
+            purgados.append(nombre)
+        return purgados
+
+    @con_escritura
+    def _compactar_archivo(self, nombre: str) -> int:
+        archivos, archivo = self._localizar(nombre)
+        if archivo is None or "hashes" in archivo:
+            return 0
+        refs = self._indice_bloques(archivo)
+        if not self._saltos(refs):
+            return 0
+        bloques = [self.almacen.leer_bloque(ref) or {} for ref in refs]
+        if any(bloque.get("danado") for bloque in bloques):
+            # copiar un bloque dañado le daría una suma nueva y ocultaría el daño
+            return 0
+        nuevos = self.almacen.asignar(len(refs), nombre)
+        if self._saltos(nuevos):
+            for ref in nuevos:
+                self.almacen.liberar_bloque(ref)
+            return 0
+        for i, bloque in enumerate(bloques):
+            eof = (i == len(refs) - 1)
+            self.almacen.escribir_bloque(nuevos[i], bloque.get("datos", ""), None if eof else nuevos[i + 1], eof)
+        self.almacen.sincronizar()
+        self._indices_bloques.pop(nombre, None)
+        archivo[self.almacen.clave_inicial] = nuevos[0]
+        self._guardar_tabla_fat(archivos, [archivo])
+        for ref in refs:
+            self.almacen.liberar_bloque(ref)
+        self.almacen.sincronizar()
+        self._recordar_indice(archivo, nuevos)
+        return len(refs)
+
+    @instrumentado
+    def compactar(self, max_archivos: Optional[int] = None) -> dict:
+        resumen = {"revisados": 0, "compactados": 0, "bloques_movidos": 0, "terminado": True}
+        if self.almacen.tipo != "empaquetado":
+            return resumen
+        with self.cerrojo.lectura():
+            nombres = sorted(a["nombre"] for a in self._leer_tabla_fat())
+        inicio = 0 if self._ultimo_compactado is None else bisect.bisect_right(nombres, self._ultimo_compactado)
+        pendientes = nombres[inicio:]
+        if max_archivos is not None and len(pendientes) > max_archivos:
+            pendientes = pendientes[:max_archivos]
+            resumen["terminado"] = False
+        for nombre in pendientes:
+            movidos = self._compactar_archivo(nombre)
+            resumen["revisados"] += 1
+            resumen["compactados"] += bool(movidos)
+            resumen["bloques_movidos"] += movidos
+            self._ultimo_compactado = nombre
+        if resumen["terminado"]:
+            self._ultimo_compactado = None
+        return resumen
+
+    @instrumentado
+    def verificar(self, rapido: bool = False, reparar: bool = False, procesos: Optional[int] = None) -> dict:
+        # rapido solo mira la FAT y el mapa de ocupación; el modo completo recorre todas las cadenas en procesos
+        if rapido and reparar:
+            raise ValueError("La reparación necesita el modo completo.")
+        informe = {"modo": "rapido" if rapido else "completo", "archivos": 0, "reparados": [], "liberados": 0}
+        informe.update({problema: [] for problema in PROBLEMAS})
+        with self.cerrojo.escritura() if reparar else self.cerrojo.lectura():
+            archivos = self._leer_tabla_fat()
+            informe["archivos"] = len(archivos)
+            if rapido:
+                self._verificar_metadatos(archivos, informe)
+            else:
+                self._verificar_cadenas(archivos, informe, reparar, procesos)
+        informe["correcto"] = not any(informe[problema] for problema in PROBLEMAS)
+        return informe
+
+    def _anotar_cruces(self, archivos: list, cruces: dict, informe: dict):
+        por_clave = {}
+        if any(isinstance(dueno, tuple) for duenos in cruces.values() for dueno in duenos):
+            for archivo in archivos:
+                for clave in archivo.get("hashes", ()):
+                    por_clave.setdefault(clave, set()).add(archivo["nombre"])
+        for ref, duenos in cruces.items():
+            nombres = set()
+            for dueno in duenos:
+                nombres.update(por_clave.get(dueno[1], ()) if isinstance(dueno, tuple) else (dueno,))
+            informe["cruzados"].append({"ref": ref, "archivos": sorted(nombres)})
+
+    def _verificar_metadatos(self, archivos: list, informe: dict):
+        normalizar = self.almacen.normalizar
+        duenos = []
+        for archivo in archivos:
+            nombre = archivo["nombre"]
+            if "hashes" in archivo:
+                refs = archivo["bloques"]
+                duenos.extend((normalizar(ref), ("#", clave)) for ref, clave in zip(refs, archivo["hashes"]))
+                esperados = max(1, -(-archivo.get("tamaño", 0) // self._tamano_bloque(archivo)))
+                if len(refs) != esperados or len(archivo["hashes"]) != len(refs):
+                    informe["tamanos_incorrectos"].append(
+                        {"nombre": nombre, "tamaño": archivo.get("tamaño", 0), "real": None})
+            else:
+                refs = [self._ref_inicial(archivo)]
+                duenos.append((normalizar(refs[0]), nombre))
+            falta = next((ref for ref in refs if not self.almacen.ocupado(ref)), None)
+            if falta is not None or not refs:
+                informe["enlaces_rotos"].append({"nombre": nombre, "ref": falta})
+        self._anotar_cruces(archivos, agrupar_cruces(duenos), informe)
+
+    def _verificar_cadenas(self, archivos: list, informe: dict, reparar: bool, procesos: Optional[int]):
+        trabajos = [(a["nombre"], self._ref_inicial(a), a.get("bloques") if "hashes" in a else None, a.get("hashes"))
+                    for a in archivos]
+        if procesos == 1 or not trabajos:
+            verificar_bloques = self.almacen.verificar
+            self.almacen.verificar = True
+            try:
+                resultados = [revisar_archivo(self.almacen, *trabajo) for trabajo in trabajos]
+            finally:
+                self.almacen.verificar = verificar_bloques
+        else:
+            self.almacen.sincronizar()
+            resultados = recorrer_cadenas(self.almacen.tipo, self.data_dir, trabajos, procesos)
+        por_nombre = {a["nombre"]: a for a in archivos}
+        normalizar = self.almacen.normalizar
+        duenos = []
+        for nombre, refs, problema, ref_problema, danados, real in resultados:
+            archivo = por_nombre[nombre]
+            if problema == "roto":
+                informe["enlaces_rotos"].append({"nombre": nombre, "ref": ref_problema})
+            elif problema == "ciclo":
+                informe["ciclos"].append({"nombre": nombre, "ref": ref_problema})
+            informe["sumas_incorrectas"].extend({"nombre": nombre, "ref": ref} for ref in danados)
+            if not danados and real != archivo.get("tamaño", 0):
+                informe["tamanos_incorrectos"].append({"nombre": nombre, "tamaño": archivo.get("tamaño", 0),
+                                                       "real": real})
+            if "hashes" in archivo:
+                duenos.extend((normalizar(ref), ("#", clave)) for ref, clave in zip(refs, archivo["hashes"]))
+            else:
+                duenos.extend((normalizar(ref), nombre) for ref in refs)
+        cruces = agrupar_cruces(duenos)
+        self._anotar_cruces(archivos, cruces, informe)
+        usados = {ref for ref, _ in duenos}
+        informe["huerfanos"] = [ref for ref in self.almacen.ocupados() if normalizar(ref) not in usados]
+        if reparar:
+            self._reparar(archivos, resultados, cruces, usados, informe)
+
+    def _refs_libres(self, n: int, nombre: str, usados: set) -> list:
+        desde = 0
+        while True:
+            refs = self.almacen.asignar(n, nombre, desde)
+            if not usados.intersection(map(self.almacen.normalizar, refs)):
+                return refs
+            desde += n
+
+    def _reparar(self, archivos: list, resultados: list, cruces: dict, usados: set, informe: dict):
+        # cada archivo cruzado con otro se queda con una copia propia de su cadena; las cadenas rotas o con
+        # ciclos se cortan en el último bloque legible y el tamaño pasa a ser el que realmente se puede leer
+        copiar = set()
+        for duenos in cruces.values():
+            nombres = sorted(dueno for dueno in duenos if not isinstance(dueno, tuple))
+            copiar.update(nombres if len(nombres) < len(duenos) else nombres[1:])
+        por_nombre = {a["nombre"]: a for a in archivos}
+        self._dedup = None
+        cambiados = []
+        for nombre, refs, problema, _, danados, real in resultados:
+            archivo = por_nombre[nombre]
+            cambia_tamano = not danados and real != archivo.get("tamaño", 0)
+            if "hashes" in archivo:
+                if problema is None and not cambia_tamano:
+                    continue
+                if refs:
+                    self._fijar_dedup(archivo, refs, archivo["hashes"][:len(refs)])
+                else:
+                    self._fijar_dedup(archivo, *self._escribir_dedup(archivos, [""], codec=archivo.get("codec"))[:2])
+                    real = 0
+            else:
+                if problema is None and not cambia_tamano and nombre not in copiar:
+                    continue
+                cargas = [(self.almacen.leer_bloque(ref) or {}).get("datos", "") for ref in refs] or [""]
+                destino = refs if refs and nombre not in copiar else self._refs_libres(len(cargas), nombre, usados)
+                nuevos = self._escribir_cadena(cargas, nombre, destino)
+                usados.update(map(self.almacen.normalizar, nuevos))
+                archivo[self.almacen.clave_inicial] = nuevos[0]
+                archivo["tamaño_fisico"] = sum(map(tamano_fisico, cargas))
+                self._indices_bloques.pop(nombre, None)
+            if not danados:
+                archivo["tamaño"] = real
+            archivo["version"] = os.urandom(8).hex()
+            cambiados.append(archivo)
+            informe["reparados"].append(nombre)
+        self._dedup = None
+        alcanzados = set()
+        for archivo in archivos:
+            refs = archivo["bloques"] if "hashes" in archivo else self._refs_cadena(self._ref_inicial(archivo))
+            alcanzados.update(map(self.almacen.normalizar, refs))
+        for ref in list(self.almacen.ocupados()):
+            if self.almacen.normalizar(ref) not in alcanzados:
+                self.almacen.liberar_bloque(ref)
+                informe["liberados"] += 1
+        self.almacen.sincronizar()
+        self._guardar_tabla_fat(archivos, cambiados)
+        if self.indice_texto is not None:
+            for archivo in cambiados:
+                try:
+                    self.indice_texto.poner(archivo["nombre"], self._concatenar_bloques(archivo))
+                except OSError:
+                    continue
+
+    def iniciar_mantenimiento(self, intervalo: float = 60.0, dias_papelera: Optional[float] = None,
+                              cuota_papelera: Optional[int] = None, archivos_por_paso: int = 10):
+        if self._mantenimiento is not None:
+            return
+
+        def ciclo():
+            while not self._detener_mantenimiento.wait(intervalo):
+                try:
+                    if dias_papelera is not None or cuota_papelera is not None:
+                        self.vaciar_papelera(dias_papelera, cuota_papelera, archivos_por_paso)
+                    self.compactar(archivos_por_paso)
+                except Exception as e:
+                    self.error_mantenimiento = e
+
+        self._detener_mantenimiento.clear()
+        self._mantenimiento = threading.Thread(target=ciclo, name="fat-mantenimiento", daemon=True)
+        self._mantenimiento.start()
+
+    def detener_mantenimiento(self):
+        if self._mantenimiento is None:
+            return
+        self._detener_mantenimiento.set()
+        self._mantenimiento.join()
+        self._mantenimiento = None
+
+    def _archivo_escribible(self, nombre: str, rol: str):
+        archivos, archivo = self._localizar(nombre)
+        if not archivo or archivo.get("papelera", False):
             raise FileNotFoundError(f"El archivo '{nombre}' no existe o está en la papelera.")
         permisos = archivo.get("permisos", {})
         if rol != archivo.get("owner") and "escribir" not in permisos.get(rol, []):
             raise PermissionError("No tienes permiso para modificar este archivo.")
-        self._eliminar_bloques_fisicos(nombre)
-        nueva_ruta = self.separar_por_bloque(nuevo_contenido, nombre)
-        archivo["ruta_inicial"] = nueva_ruta
+        return archivos, archivo
+
+    @instrumentado
+    @con_escritura
+    def modificar_archivo(self, nombre: str, nuevo_contenido: str, rol: str):
+        archivos, archivo = self._archivo_escribible(nombre, rol)
+        bloques = self._dividir(nuevo_contenido, self._tamano_bloque(archivo))
+        if "hashes" in archivo:
+            refs, hashes, fisico = self._escribir_dedup(archivos, bloques, archivo["hashes"], archivo.get("codec"))
+            self._fijar_dedup(archivo, refs, hashes)
+        else:
+            refs_previas = self._indice_bloques(archivo)
+            self._indices_bloques.pop(nombre, None)
+            cargas = self._codificar(bloques, archivo.get("codec"))
+            refs = self._escribir_cadena(cargas, nombre, refs_previas)
+            archivo[self.almacen.clave_inicial] = refs[0]
+            fisico = sum(map(tamano_fisico, cargas))
         archivo["tamaño"] = len(nuevo_contenido)
+        archivo["tamaño_fisico"] = fisico
         archivo["fecha_modificacion"] = datetime.now().isoformat(sep=" ", timespec="seconds")
-        self._guardar_tabla_fat(archivos)
+        archivo["version"] = os.urandom(8).hex()
+        self._guardar_tabla_fat(archivos, [archivo])
+        self._recordar_indice(archivo, refs)
+        if self.indice_texto is not None:
+            self.indice_texto.poner(nombre, nuevo_contenido)
 
+    @instrumentado
+    @con_escritura
+    def anexar(self, nombre: str, texto: str, rol: str):
+        archivos, archivo = self._archivo_escribible(nombre, rol)
+        if not texto:
+            return
+        refs_previas = self._indice_bloques(archivo)
+        self._indices_bloques.pop(nombre, None)
+        codec = archivo.get("codec")
+        fisico = archivo.get("tamaño_fisico", archivo.get("tamaño", 0))
+        if "hashes" in archivo:
+            hashes_previos = archivo["hashes"]
+            ultimo = self._leer_datos(refs_previas[-1], hashes_previos[-1]) or ""
+            bloques = self._dividir(ultimo + texto, self._tamano_bloque(archivo))
+            cola, hashes_cola, fisico_cola = self._escribir_dedup(archivos, bloques, hashes_previos[-1:], codec)
+            refs = refs_previas[:-1] + cola
+            self._fijar_dedup(archivo, refs, hashes_previos[:-1] + hashes_cola)
+            fisico += fisico_cola - tamano_fisico(self._codificar([ultimo], codec)[0])
+        elif refs_previas:
+            previo = self.almacen.leer_bloque(refs_previas[-1]) or {}
+            carga_previa = previo.get("datos", "")
+            bloques = self._dividir(self._datos_bloque(refs_previas[-1], previo) + texto, self._tamano_bloque(archivo))
+            cargas = self._codificar(bloques, codec)
+            cola = self._escribir_cadena(cargas, nombre, refs_previas[-1:], len(refs_previas) - 1)
+            refs = refs_previas[:-1] + cola
+            fisico += sum(map(tamano_fisico, cargas)) - tamano_fisico(carga_previa)
+        else:
+            cargas = self._codificar(self._dividir(texto, self._tamano_bloque(archivo)), codec)
+            refs = self._escribir_cadena(cargas, nombre)
+            archivo[self.almacen.clave_inicial] = refs[0]
+            fisico = sum(map(tamano_fisico, cargas))
+        archivo["tamaño"] = archivo.get("tamaño", 0) + len(texto)
+        archivo["tamaño_fisico"] = fisico
+        archivo["fecha_modificacion"] = datetime.now().isoformat(sep=" ", timespec="seconds")
+        archivo["version"] = os.urandom(8).hex()
+        self._guardar_tabla_fat(archivos, [archivo])
+        self._recordar_indice(archivo, refs)
+        if self.indice_texto is not None and not self.indice_texto.anexar(nombre, texto):
+            self.indice_texto.poner(nombre, self._concatenar_bloques(archivo))
+
+    @instrumentado
+    @con_escritura
     def asignar_permisos(self, nombre: str, solicitante_rol: str, rol_a_modificar: str, permisos: List[str]):
-        archivos = self._leer_tabla_fat()
-        archivo = next((a for a in archivos if a["nombre"] == nombre), None)
+        archivos, archivo = self._localizar(nombre)
         if not archivo:
             return False, f"Archivo '{nombre}' no encontrado."
         if solicitante_rol != archivo.get("owner"):
@@ -160,5 +1242,80 @@ class FATManager:
         else:
             if rol_a_modificar in archivo.get("permisos", {}):
                 del archivo["permisos"][rol_a_modificar]
-        self._guardar_tabla_fat(archivos)
+        self._guardar_tabla_fat(archivos, [archivo])
         return True, "Permisos actualizados correctamente."
+
+
+def _completar_migracion(data_dir: str):
+    # una migración queda confirmada al registrar el nuevo tipo en volumen.json con "migrando"; desde ahí solo
+    # falta colocar sus archivos y retirar el almacén antiguo, y se puede repetir si se interrumpe
+    volumen = leer_volumen(data_dir)
+    if volumen is None or not volumen.get("migrando"):
+        return
+    provisional = os.path.join(data_dir, "migracion")
+    path_bloques = os.path.join(data_dir, "bloques")
+    if volumen["almacen"] == "empaquetado":
+        for nombre in os.listdir(path_bloques) if os.path.isdir(path_bloques) else ():
+            os.remove(os.path.join(path_bloques, nombre))
+    else:
+        for nombre in ("bloques.dat", "bloques.mapa"):
+            if os.path.exists(os.path.join(data_dir, nombre)):
+                os.remove(os.path.join(data_dir, nombre))
+    for nombre in ("bloques.dat", "bloques.mapa", "fat_table.json"):
+        if os.path.exists(os.path.join(provisional, nombre)):
+            os.replace(os.path.join(provisional, nombre), os.path.join(data_dir, nombre))
+    if os.path.exists(os.path.join(data_dir, "fat_table.diario")):
+        with open(os.path.join(data_dir, "fat_table.diario"), "w", encoding="utf-8"):
+            pass
+    shutil.rmtree(provisional, ignore_errors=True)
+    escribir_volumen(data_dir, {"almacen": volumen["almacen"]})
+
+
+def migrar_almacen(data_dir: str, destino: str) -> int:
+    origen = FATManager(data_dir)
+    try:
+        with origen.cerrojo.escritura():
+            if origen.almacen.tipo == destino:
+                return 0
+            archivos = origen._leer_tabla_fat()
+            tamano_bloque = max((origen._tamano_bloque(a) for a in archivos), default=TAMANO_BLOQUE)
+            # el volumen nuevo se monta aparte y el actual sigue intacto hasta confirmar
+            provisional = os.path.join(data_dir, "migracion")
+            shutil.rmtree(provisional, ignore_errors=True)
+            nuevo = FATManager(provisional, almacen=destino, tamano_bloque=tamano_bloque, bloqueo_procesos=False)
+            if destino == "json":
+                # los enlaces entre bloques JSON llevan su ruta, así que se escriben ya en bloques/, que el
+                # almacén empaquetado no usa; lo que quede de un intento anterior se descarta
+                nuevo.almacen.cerrar()
+                for nombre in os.listdir(origen.path_bloques):
+                    os.remove(os.path.join(origen.path_bloques, nombre))
+                nuevo.almacen = crear_almacen(destino, data_dir)
+                nuevo.almacen.instrumentacion = nuevo.instrumentacion
+            antiguos = []
+            for archivo in archivos:
+                antiguo = {"nombre": archivo["nombre"],
+                           origen.almacen.clave_inicial: archivo.pop(origen.almacen.clave_inicial, None)}
+                for clave in ("bloques", "hashes"):
+                    if clave in archivo:
+                        antiguo[clave] = archivo.pop(clave)
+                antiguos.append(antiguo)
+            for archivo, antiguo in zip(archivos, antiguos):
+                if not nuevo.almacen.admite_codec:
+                    archivo["codec"] = None
+                bloques = nuevo._dividir(origen._concatenar_bloques(antiguo), nuevo._tamano_bloque(archivo))
+                if "hashes" in antiguo:
+                    refs, hashes, fisico = nuevo._escribir_dedup(archivos, bloques, codec=archivo.get("codec"))
+                    nuevo._fijar_dedup(archivo, refs, hashes)
+                else:
+                    cargas = nuevo._codificar(bloques, archivo.get("codec"))
+                    archivo[nuevo.almacen.clave_inicial] = nuevo._escribir_cadena(cargas, archivo["nombre"])[0]
+                    fisico = sum(map(tamano_fisico, cargas))
+                archivo["tamaño_fisico"] = fisico
+            nuevo._guardar_tabla_fat(archivos)
+            nuevo.cerrar()
+            escribir_volumen(data_dir, {"almacen": destino, "migrando": True})
+            origen.almacen.cerrar()
+            _completar_migracion(data_dir)
+            return len(archivos)
+    finally:
+        origen.cerrar()
@@ -0,0 +1,267 @@
+import bisect
+import json
+import os
+import re
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+from indices_fat import FIN
+
+_PALABRA = re.compile(r"\w+")
+_CARACTER_PALABRA = re.compile(r"\w")
+_CONSULTA = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def tokenizar(texto: str) -> List[str]:
+    return _PALABRA.findall(texto.lower())
+
+
+def _termina_en_palabra(texto: str) -> bool:
+    return bool(texto) and _CARACTER_PALABRA.match(texto[-1]) is not None
+
+
+class IndiceTexto:
+    # Índice invertido con posiciones. Se persiste como una instantánea (indice_texto.json) más un diario de
+    # operaciones numeradas (indice_texto.diario); al reproducir se saltan las ya incluidas en la instantánea.
+    # La instantánea solo se reescribe cuando el diario ya ocupa tanto como ella, así que su coste no crece con
+    # el tamaño del volumen en cada operación.
+    def __init__(self, data_dir: str, compactar_cada: int = 1000):
+        self.path = os.path.join(data_dir, "indice_texto.json")
+        self.path_diario = os.path.join(data_dir, "indice_texto.diario")
+        self.compactar_cada = compactar_cada
+        self.existia = os.path.exists(self.path)
+        self._lock = threading.RLock()
+        self._docs = {}
+        self._terminos = {}
+        self._vocabulario = None
+        self._secuencia = 0
+        self._firma = None
+        self._desplazamiento = 0
+        self._pendientes_compactar = 0
+        # la instantánea se carga en el primer uso (todas las operaciones sincronizan antes)
+
+    def _firma_instantanea(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def _vaciar_memoria(self):
+        self._docs = {}
+        self._terminos = {}
+        self._vocabulario = None
+        self._secuencia = 0
+
+    def sincronizar(self):
+        with self._lock:
+            firma = self._firma_instantanea()
+            if firma != self._firma:
+                self._vaciar_memoria()
+                if firma is not None:
+                    with open(self.path, "r", encoding="utf-8") as f:
+                        datos = json.load(f)
+                    self._secuencia = datos.get("secuencia", 0)
+                    for nombre, doc in datos.get("docs", {}).items():
+                        self._cargar_doc(nombre, doc)
+                self._firma = firma
+                self._desplazamiento = 0
+            if not os.path.exists(self.path_diario):
+                return
+            with open(self.path_diario, "rb") as f:
+                f.seek(self._desplazamiento)
+                nuevo = f.read()
+            # una línea sin salto final es una escritura a medias: se deja para la próxima vez
+            completo = nuevo[:nuevo.rfind(b"\n") + 1]
+            self._desplazamiento += len(completo)
+            for linea in completo.decode("utf-8").splitlines():
+                try:
+                    registro = json.loads(linea)
+                except json.JSONDecodeError:
+                    continue
+                if registro.get("seq", 0) > self._secuencia:
+                    self._aplicar(registro)
+                    self._secuencia = registro["seq"]
+                    self._pendientes_compactar += 1
+
+    def _cargar_doc(self, nombre: str, doc: dict):
+        self._docs[nombre] = doc
+        for termino, posiciones in doc["terminos"].items():
+            self._terminos.setdefault(termino, {})[nombre] = posiciones
+
+    def _aplicar(self, registro: dict):
+        if registro["op"] == "poner":
+            self._poner(registro["nombre"], registro["texto"])
+        elif registro["op"] == "poner_lote":
+            for nombre, texto in registro["docs"]:
+                self._poner(nombre, texto)
+        elif registro["op"] == "anexar":
+            self._anexar(registro["nombre"], registro["texto"])
+        elif registro["op"] == "quitar":
+            self._quitar(registro["nombre"])
+
+    def _agregar_tokens(self, nombre: str, doc: dict, tokens: List[str]):
+        for posicion, token in enumerate(tokens, doc["n"]):
+            posiciones = doc["terminos"].get(token)
+            if posiciones is None:
+                posiciones = doc["terminos"][token] = []
+                documentos = self._terminos.setdefault(token, {})
+                if not documentos:
+                    self._vocabulario = None
+                documentos[nombre] = posiciones
+            posiciones.append(posicion)
+        doc["n"] += len(tokens)
+
+    def _quitar_termino(self, nombre: str, doc: dict, termino: str):
+        del doc["terminos"][termino]
+        documentos = self._terminos[termino]
+        del documentos[nombre]
+        if not documentos:
+            del self._terminos[termino]
+            self._vocabulario = None
+
+    def _quitar(self, nombre: str):
+        doc = self._docs.pop(nombre, None)
+        if doc is None:
+            return
+        for termino in list(doc["terminos"]):
+            self._quitar_termino(nombre, doc, termino)
+
+    def _poner(self, nombre: str, texto: str):
+        self._quitar(nombre)
+        doc = self._docs[nombre] = {"terminos": {}, "n": 0, "cola": ""}
+        tokens = tokenizar(texto)
+        self._agregar_tokens(nombre, doc, tokens)
+        doc["cola"] = tokens[-1] if tokens and _termina_en_palabra(texto) else ""
+
+    def _anexar(self, nombre: str, texto: str) -> bool:
+        doc = self._docs.get(nombre)
+        if doc is None:
+            return False
+        tokens = tokenizar(texto)
+        if doc["cola"] and tokens and _CARACTER_PALABRA.match(texto[0]):
+            # la palabra que quedó abierta al final continúa en el texto anexado
+            posiciones = doc["terminos"][doc["cola"]]
+            posiciones.pop()
+            if not posiciones:
+                self._quitar_termino(nombre, doc, doc["cola"])
+            doc["n"] -= 1
+            tokens[0] = doc["cola"] + tokens[0]
+        self._agregar_tokens(nombre, doc, tokens)
+        if texto:
+            doc["cola"] = tokens[-1] if tokens and _termina_en_palabra(texto) else ""
+        return True
+
+    def _registrar(self, registro: dict):
+        self._secuencia += 1
+        registro["seq"] = self._secuencia
+        linea = (json.dumps(registro, ensure_ascii=False) + "\n").encode("utf-8")
+        with open(self.path_diario, "ab") as f:
+            f.write(linea)
+            self._desplazamiento = f.tell()
+        self._pendientes_compactar += 1
+        instantanea = self._firma[1] if self._firma is not None else 0
+        if self._pendientes_compactar >= self.compactar_cada and self._desplazamiento >= instantanea:
+            self.compactar()
+
+    def poner(self, nombre: str, texto: str):
+        with self._lock:
+            self.sincronizar()
+            self._poner(nombre, texto)
+            self._registrar({"op": "poner", "nombre": nombre, "texto": texto})
+
+    def poner_lote(self, documentos: Iterable[Tuple[str, str]]):
+        with self._lock:
+            self.sincronizar()
+            documentos = [[nombre, texto] for nombre, texto in documentos]
+            for nombre, texto in documentos:
+                self._poner(nombre, texto)
+            self._registrar({"op": "poner_lote", "docs": documentos})
+
+    def anexar(self, nombre: str, texto: str) -> bool:
+        with self._lock:
+            self.sincronizar()
+            if not self._anexar(nombre, texto):
+                return False
+            self._registrar({"op": "anexar", "nombre": nombre, "texto": texto})
+            return True
+
+    def quitar(self, nombre: str):
+        with self._lock:
+            self.sincronizar()
+            if nombre not in self._docs:
+                return
+            self._quitar(nombre)
+            self._registrar({"op": "quitar", "nombre": nombre})
+
+    def reconstruir(self, documentos: Iterable[Tuple[str, str]]):
+        with self._lock:
+            secuencia = self._secuencia
+            self._vaciar_memoria()
+            self._secuencia = secuencia
+            for nombre, texto in documentos:
+                self._poner(nombre, texto)
+            self.compactar()
+
+    def compactar(self):
+        with self._lock:
+            temporal = self.path + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump({"secuencia": self._secuencia, "docs": self._docs}, f, ensure_ascii=False,
+                          separators=(",", ":"))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temporal, self.path)
+            with open(self.path_diario, "w", encoding="utf-8"):
+                pass
+            self._firma = self._firma_instantanea()
+            self._desplazamiento = 0
+            self._pendientes_compactar = 0
+
+    def _con_prefijo(self, prefijo: str) -> Dict[str, int]:
+        if self._vocabulario is None:
+            self._vocabulario = sorted(self._terminos)
+        inicio = bisect.bisect_left(self._vocabulario, prefijo)
+        fin = bisect.bisect_left(self._vocabulario, prefijo + FIN)
+        puntuaciones = {}
+        for termino in self._vocabulario[inicio:fin]:
+            for nombre, posiciones in self._terminos[termino].items():
+                puntuaciones[nombre] = puntuaciones.get(nombre, 0) + len(posiciones)
+        return puntuaciones
+
+    def _con_frase(self, tokens: List[str]) -> Dict[str, int]:
+        listas = [self._terminos.get(token, {}) for token in tokens]
+        candidatos = set(min(listas, key=len))
+        for documentos in listas:
+            candidatos &= documentos.keys()
+        puntuaciones = {}
+        for nombre in candidatos:
+            siguientes = [set(documentos[nombre]) for documentos in listas[1:]]
+            aciertos = sum(1 for p in listas[0][nombre]
+                           if all(p + i in posiciones for i, posiciones in enumerate(siguientes, 1)))
+            if aciertos:
+                puntuaciones[nombre] = aciertos
+        return puntuaciones
+
+    def buscar(self, consulta: str) -> Dict[str, int]:
+        # palabras sueltas (todas deben aparecer), "frases exactas" y prefijos terminados en *
+        with self._lock:
+            self.sincronizar()
+            resultado = None
+            for frase, palabra in _CONSULTA.findall(consulta):
+                tokens = tokenizar(frase or palabra)
+                if not tokens:
+                    continue
+                if not frase and palabra.endswith("*") and len(tokens) == 1:
+                    parcial = self._con_prefijo(tokens[0])
+                elif len(tokens) == 1:
+                    parcial = {nombre: len(posiciones)
+                               for nombre, posiciones in self._terminos.get(tokens[0], {}).items()}
+                else:
+                    parcial = self._con_frase(tokens)
+                if resultado is None:
+                    resultado = parcial
+                else:
+                    resultado = {nombre: puntos + parcial[nombre] for nombre, puntos in resultado.items()
+                                 if nombre in parcial}
+            return resultado or {}
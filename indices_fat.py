@@ -0,0 +1,110 @@
+import bisect
+from datetime import date, datetime
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+FIN = "\U0010ffff"
+
+
+def fecha_cambio(archivo: dict) -> str:
+    return archivo.get("fecha_modificacion") or archivo.get("fecha_creacion") or ""
+
+
+def roles_legibles(archivo: dict) -> Tuple[str, ...]:
+    owner = archivo.get("owner")
+    roles = tuple(rol for rol, permisos in archivo.get("permisos", {}).items() if "leer" in permisos and rol != owner)
+    return roles if owner is None else (owner,) + roles
+
+
+def _como_texto(fecha) -> Optional[str]:
+    if isinstance(fecha, datetime):
+        return fecha.isoformat(sep=" ", timespec="seconds")
+    if isinstance(fecha, date):
+        return fecha.isoformat()
+    return fecha
+
+
+def normalizar_rango(rango) -> Optional[Tuple[Optional[str], Optional[str]]]:
+    if rango is None:
+        return None
+    desde, hasta = rango
+    return _como_texto(desde), _como_texto(hasta)
+
+
+def en_rango(valor: str, desde: Optional[str], hasta: Optional[str]) -> bool:
+    # hasta se compara como prefijo: "2024-05-01" incluye todo ese día
+    return (desde is None or valor >= desde) and (hasta is None or valor <= hasta + FIN)
+
+
+def _rango(lista: list, desde: Optional[str], hasta: Optional[str]) -> List[str]:
+    inicio = 0 if desde is None else bisect.bisect_left(lista, (desde,))
+    fin = len(lista) if hasta is None else bisect.bisect_right(lista, (hasta + FIN,))
+    return [nombre for _, nombre in lista[inicio:fin]]
+
+
+class IndicesFAT:
+    def __init__(self, archivos: Iterable[dict] = ()):
+        self._claves = {}
+        self.por_owner: Dict[str, Set[str]] = {}
+        self.legibles: Dict[str, Set[str]] = {}
+        for archivo in archivos:
+            nombre = archivo["nombre"]
+            clave = self._claves[nombre] = self._clave(archivo)
+            self.por_owner.setdefault(clave[0], set()).add(nombre)
+            for rol in clave[4]:
+                self.legibles.setdefault(rol, set()).add(nombre)
+        self.nombres = sorted(self._claves)
+        self.por_creacion = sorted([(clave[1], nombre) for nombre, clave in self._claves.items()])
+        self.por_cambio = sorted([(clave[2], nombre) for nombre, clave in self._claves.items()])
+        self.por_tamano = sorted([(clave[3], nombre) for nombre, clave in self._claves.items()])
+
+    @staticmethod
+    def _clave(archivo: dict) -> Tuple:
+        return (archivo.get("owner"), archivo.get("fecha_creacion") or "", fecha_cambio(archivo),
+                archivo.get("tamaño", 0), roles_legibles(archivo))
+
+    def __len__(self) -> int:
+        return len(self._claves)
+
+    def quitar(self, nombre: str):
+        clave = self._claves.pop(nombre, None)
+        if clave is None:
+            return
+        for lista, elemento in ((self.nombres, nombre), (self.por_creacion, (clave[1], nombre)),
+                                (self.por_cambio, (clave[2], nombre)), (self.por_tamano, (clave[3], nombre))):
+            i = bisect.bisect_left(lista, elemento)
+            if i < len(lista) and lista[i] == elemento:
+                del lista[i]
+        self.por_owner.get(clave[0], set()).discard(nombre)
+        for rol in clave[4]:
+            self.legibles.get(rol, set()).discard(nombre)
+
+    def actualizar(self, archivo: dict):
+        nombre = archivo["nombre"]
+        clave = self._clave(archivo)
+        if self._claves.get(nombre) == clave:
+            return
+        self.quitar(nombre)
+        self._claves[nombre] = clave
+        bisect.insort(self.nombres, nombre)
+        bisect.insort(self.por_creacion, (clave[1], nombre))
+        bisect.insort(self.por_cambio, (clave[2], nombre))
+        bisect.insort(self.por_tamano, (clave[3], nombre))
+        self.por_owner.setdefault(clave[0], set()).add(nombre)
+        for rol in clave[4]:
+            self.legibles.setdefault(rol, set()).add(nombre)
+
+    def con_prefijo(self, prefijo: str) -> List[str]:
+        inicio = bisect.bisect_left(self.nombres, prefijo)
+        fin = bisect.bisect_left(self.nombres, prefijo + FIN)
+        return self.nombres[inicio:fin]
+
+    def creados_entre(self, desde: Optional[str], hasta: Optional[str]) -> List[str]:
+        return _rango(self.por_creacion, desde, hasta)
+
+    def cambiados_entre(self, desde: Optional[str], hasta: Optional[str]) -> List[str]:
+        return _rango(self.por_cambio, desde, hasta)
+
+    def con_tamano(self, minimo: Optional[int], maximo: Optional[int]) -> List[str]:
+        inicio = 0 if minimo is None else bisect.bisect_left(self.por_tamano, (minimo,))
+        fin = len(self.por_tamano) if maximo is None else bisect.bisect_left(self.por_tamano, (maximo + 1,))
+        return [nombre for _, nombre in self.por_tamano[inicio:fin]]
@@ -0,0 +1,132 @@
+import cProfile
+import copy
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Optional
+
+LIMITES_MS = (0.1, 0.5, 1, 5, 10, 50, 100, 500, 1000, float("inf"))
+CONTADORES = ("bloques_leidos", "bloques_escritos", "bytes_codificados", "parseos_json", "llamadas_fs")
+
+
+def _estadistica_vacia() -> dict:
+    estadistica = {"llamadas": 0, "errores": 0, "segundos": 0.0, "max_ms": 0.0, "histograma_ms": [0] * len(LIMITES_MS)}
+    estadistica.update((contador, 0) for contador in CONTADORES)
+    return estadistica
+
+
+class Instrumentacion:
+    def __init__(self, perfilar: bool = False):
+        self.perfilar = perfilar
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._operaciones = {}
+        self._perfiles = {}
+        # cProfile admite un solo perfil activo por intérprete: las operaciones que coinciden con otra perfilada
+        # corren sin perfil y se cuentan en perfiles_omitidos
+        self._perfilando = threading.Lock()
+        self.perfiles_omitidos = 0
+        self._hooks = []
+        self.errores_hooks = 0
+        self.error_hook = None
+
+    def agregar_hook(self, hook: Callable[[str, float, dict, Optional[BaseException]], None]):
+        self._hooks.append(hook)
+
+    def quitar_hook(self, hook):
+        self._hooks.remove(hook)
+
+    def contar(self, contador: str, n: int = 1):
+        actual = getattr(self._local, "contadores", None)
+        if actual is not None:
+            actual[contador] += n
+            return
+        with self._lock:
+            self._operaciones.setdefault("sin_operacion", _estadistica_vacia())[contador] += n
+
+    @contextmanager
+    def operacion(self, nombre: str):
+        if getattr(self._local, "contadores", None) is not None:
+            yield
+            return
+        contadores = dict.fromkeys(CONTADORES, 0)
+        self._local.contadores = contadores
+        perfil = None
+        if self.perfilar:
+            if self._perfilando.acquire(blocking=False):
+                with self._lock:
+                    perfil = self._perfiles.setdefault(nombre, cProfile.Profile())
+                try:
+                    perfil.enable()
+                except ValueError:
+                    # hay otra herramienta de perfilado activa fuera de esta instrumentación
+                    perfil = None
+                    self._perfilando.release()
+            if perfil is None:
+                with self._lock:
+                    self.perfiles_omitidos += 1
+        error = None
+        inicio = time.perf_counter()
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            if perfil is not None:
+                perfil.disable()
+                self._perfilando.release()
+            segundos = time.perf_counter() - inicio
+            self._local.contadores = None
+            self._registrar(nombre, segundos, contadores, error)
+
+    def _registrar(self, nombre: str, segundos: float, contadores: dict, error: Optional[BaseException]):
+        ms = segundos * 1000
+        with self._lock:
+            estadistica = self._operaciones.setdefault(nombre, _estadistica_vacia())
+            estadistica["llamadas"] += 1
+            estadistica["errores"] += error is not None
+            estadistica["segundos"] += segundos
+            estadistica["max_ms"] = max(estadistica["max_ms"], ms)
+            estadistica["histograma_ms"][next(i for i, limite in enumerate(LIMITES_MS) if ms <= limite)] += 1
+            for contador, n in contadores.items():
+                estadistica[contador] += n
+        for hook in list(self._hooks):
+            # un hook que falla no cambia el resultado de la operación medida
+            try:
+                hook(nombre, segundos, contadores, error)
+            except Exception as e:
+                with self._lock:
+                    self.errores_hooks += 1
+                    self.error_hook = e
+
+    def instantanea(self) -> dict:
+        with self._lock:
+            return {"limites_ms": list(LIMITES_MS[:-1]) + ["inf"], "operaciones": copy.deepcopy(self._operaciones),
+                    "errores_hooks": self.errores_hooks, "perfiles_omitidos": self.perfiles_omitidos}
+
+    def reiniciar(self):
+        with self._lock:
+            self._operaciones.clear()
+            self._perfiles.clear()
+
+    def volcar_perfiles(self, directorio: str) -> list:
+        os.makedirs(directorio, exist_ok=True)
+        rutas = []
+        with self._lock:
+            perfiles = dict(self._perfiles)
+        for nombre, perfil in perfiles.items():
+            ruta = os.path.join(directorio, f"{nombre}.prof")
+            perfil.dump_stats(ruta)
+            rutas.append(ruta)
+        return rutas
+
+
+def instrumentado(metodo):
+    @functools.wraps(metodo)
+    def envoltura(self, *args, **kwargs):
+        with self.instrumentacion.operacion(metodo.__name__):
+            return metodo(self, *args, **kwargs)
+    return envoltura
@@ -1,8 +1,13 @@
 import tkinter as tk
 from tkinter import messagebox, ttk
-from fat_logic import FATManager
+from concurrent.futures import ThreadPoolExecutor
+from fat_logic import PROBLEMAS, TAMANO_BLOQUE, FATManager
 import json
 import os
+import queue
+
+TAMANO_PAGINA = 200
+TROZO_LECTURA = 16384
 
 class LoginWindow:
     def __init__(self, master):
@@ -45,17 +50,56 @@ class InterfazFAT:
     def __init__(self, master, rol, acciones, usuarios_path):
         self.master = master
         self.master.title(f"Simulador de Sistema FAT - {rol}")
-        self.master.geometry("600x500")
+        self.master.geometry("600x600")
         self.rol = rol
         self.acciones = acciones
         self.usuarios_path = usuarios_path
         with open(usuarios_path, "r", encoding="utf-8") as a:
             self.permisos_globales = json.load(a)
-        self.fat = FATManager()
+        self.fat = FATManager(cache=True)
+        # Las operaciones FAT corren en un único hilo (en orden); sus resultados vuelven al hilo de Tk por una cola
+        self._trabajador = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fat-ui")
+        self._resultados = queue.Queue()
+        self._pendientes = 0
+        self._nombres = []
+        self._filtrados = []
+        self._filtro = None
+        self._filtro_programado = None
+        self._pagina = 0
         tk.Label(master, text=f"Sistema de Archivos FAT ({rol})", font=("Arial", 14, "bold")).pack(pady=10)
         tk.Label(master, text=f"Permisos: {', '.join(self.acciones)}", font=("Arial", 10)).pack(pady=3)
+        frame_filtro = tk.Frame(master)
+        frame_filtro.pack(pady=5)
+        tk.Label(frame_filtro, text="Filtrar:").pack(side="left")
+        self.entry_filtro = tk.Entry(frame_filtro, width=50)
+        self.entry_filtro.pack(side="left", padx=5)
+        self.entry_filtro.bind("<KeyRelease>", self.programar_filtro)
+        self.var_legibles = tk.BooleanVar(value=False)
+        tk.Checkbutton(frame_filtro, text="Solo legibles", variable=self.var_legibles,
+                       command=self.actualizar_lista).pack(side="left")
+        frame_busqueda = tk.Frame(master)
+        frame_busqueda.pack()
+        tk.Label(frame_busqueda, text="Buscar en contenido:").pack(side="left")
+        self.entry_busqueda = tk.Entry(frame_busqueda, width=40)
+        self.entry_busqueda.pack(side="left", padx=5)
+        self.entry_busqueda.bind("<Return>", self.buscar_contenido)
+        btn_buscar = tk.Button(frame_busqueda, text="Buscar", command=self.buscar_contenido)
+        btn_buscar.pack(side="left")
+        if self.fat.indice_texto is None:
+            # la interfaz no activa el índice por su cuenta: lo crea "fat_cli.py buscar"
+            self.entry_busqueda.config(state="disabled")
+            btn_buscar.config(state="disabled")
+            tk.Label(frame_busqueda, text="(sin índice de texto)", fg="gray").pack(side="left", padx=5)
         self.lista = tk.Listbox(master, width=70, height=12)
-        self.lista.pack(pady=10)
+        self.lista.pack(pady=5)
+        frame_paginas = tk.Frame(master)
+        frame_paginas.pack()
+        self.btn_anterior = tk.Button(frame_paginas, text="< Anterior", command=lambda: self.cambiar_pagina(-1))
+        self.btn_anterior.pack(side="left", padx=5)
+        self.lbl_pagina = tk.Label(frame_paginas, text="")
+        self.lbl_pagina.pack(side="left", padx=5)
+        self.btn_siguiente = tk.Button(frame_paginas, text="Siguiente >", command=lambda: self.cambiar_pagina(1))
+        self.btn_siguiente.pack(side="left", padx=5)
         frame_botones = tk.Frame(master)
         frame_botones.pack(pady=10)
         self.btn_crear = tk.Button(frame_botones, text="Crear archivo", command=self.ventana_crear)
@@ -72,8 +116,61 @@ class InterfazFAT:
         self.btn_ver_papelera.grid(row=0, column=5, padx=5)
         self.btn_asignar = tk.Button(frame_botones, text="Asignar permisos", command=self.ventana_asignar)
         self.btn_asignar.grid(row=0, column=6, padx=5)
+        self.btn_estadisticas = tk.Button(frame_botones, text="Estadísticas", command=self.ver_estadisticas)
+        self.btn_estadisticas.grid(row=0, column=7, padx=5)
+        self.lbl_estado = tk.Label(master, text="", fg="gray")
+        self.lbl_estado.pack()
+        self.master.protocol("WM_DELETE_WINDOW", self.cerrar)
         self.actualizar_botones()
+        self._atender_resultados()
         self.actualizar_lista()
+        self.ejecutar(lambda: self.fat.verificar(rapido=True), self._avisar_verificacion)
+
+    def ejecutar(self, funcion, al_terminar=None, al_fallar=None):
+        self._pendientes += 1
+        self.lbl_estado.config(text="Trabajando...")
+        def tarea():
+            try:
+                resultado = funcion()
+            except Exception as e:
+                self._resultados.put((al_fallar or self.mostrar_error, e))
+            else:
+                self._resultados.put((al_terminar, resultado))
+        self._trabajador.submit(tarea)
+
+    def _atender_resultados(self):
+        self.master.after(50, self._atender_resultados)
+        while True:
+            try:
+                callback, valor = self._resultados.get_nowait()
+            except queue.Empty:
+                return
+            self._pendientes -= 1
+            if not self._pendientes:
+                self.lbl_estado.config(text="")
+            if callback is None:
+                continue
+            try:
+                callback(valor)
+            except tk.TclError:
+                # la ventana que esperaba el resultado ya se cerró
+                pass
+
+    def _avisar_verificacion(self, informe):
+        if informe["correcto"]:
+            return
+        problemas = [f"{problema}: {len(informe[problema])}" for problema in PROBLEMAS if informe[problema]]
+        messagebox.showwarning("Verificación", "Se encontraron problemas en el volumen:\n" + "\n".join(problemas)
+                               + "\n\nEjecuta 'python fat_cli.py verificar --reparar' para revisarlo a fondo.")
+
+    def mostrar_error(self, error):
+        titulo = "Permiso denegado" if isinstance(error, PermissionError) else "Error"
+        messagebox.showerror(titulo, str(error))
+
+    def cerrar(self):
+        self._trabajador.shutdown(wait=True, cancel_futures=True)
+        self.fat.cerrar()
+        self.master.destroy()
 
     def actualizar_botones(self):
         self.btn_crear.config(state="normal" if ("crear" in self.acciones or "escribir" in self.acciones) else "disabled")
@@ -83,10 +180,99 @@ class InterfazFAT:
         self.btn_asignar.config(state="normal" if "asignar" in self.acciones else "disabled")
 
     def actualizar_lista(self):
+        consulta = self.entry_busqueda.get().strip()
+        if consulta:
+            # los resultados ya vienen filtrados por permiso de lectura y ordenados por relevancia
+            self.ejecutar(lambda: self.fat.buscar_texto(consulta, self.rol),
+                          lambda nombres: self._recibir_nombres(nombres, ordenar=False))
+        elif self.var_legibles.get():
+            def legibles():
+                return [a["nombre"] for a in self.fat.buscar(rol_legible=self.rol, por_pagina=None)["archivos"]]
+            self.ejecutar(legibles, self._recibir_nombres)
+        else:
+            self.ejecutar(self.fat.listar_archivos, self._recibir_nombres)
+
+    def buscar_contenido(self, _evento=None):
+        self._pagina = 0
+        self.actualizar_lista()
+
+    def _recibir_nombres(self, nombres, ordenar=True):
+        self._nombres = sorted(nombres) if ordenar else list(nombres)
+        self._filtro = None
+        self.aplicar_filtro(conservar_pagina=True)
+
+    def programar_filtro(self, _evento=None):
+        if self._filtro_programado is not None:
+            self.master.after_cancel(self._filtro_programado)
+        self._filtro_programado = self.master.after(150, self.aplicar_filtro)
+
+    def aplicar_filtro(self, conservar_pagina=False):
+        self._filtro_programado = None
+        texto = self.entry_filtro.get().strip().lower()
+        if texto == self._filtro:
+            return
+        # si el texto amplía el filtro anterior basta con filtrar lo ya filtrado
+        base = self._filtrados if self._filtro is not None and texto.startswith(self._filtro) else self._nombres
+        self._filtrados = [n for n in base if texto in n.lower()] if texto else list(base)
+        self._filtro = texto
+        if not conservar_pagina:
+            self._pagina = 0
+        self.mostrar_pagina()
+
+    def cambiar_pagina(self, delta):
+        self._pagina += delta
+        self.mostrar_pagina()
+
+    def mostrar_pagina(self):
+        paginas = max(1, -(-len(self._filtrados) // TAMANO_PAGINA))
+        self._pagina = max(0, min(self._pagina, paginas - 1))
+        inicio = self._pagina * TAMANO_PAGINA
         self.lista.delete(0, tk.END)
-        archivos = self.fat.listar_archivos()
-        for a in archivos:
-            self.lista.insert(tk.END, a)
+        pagina = self._filtrados[inicio:inicio + TAMANO_PAGINA]
+        if pagina:
+            self.lista.insert(tk.END, *pagina)
+        self.lbl_pagina.config(text=f"Página {self._pagina + 1} de {paginas} ({len(self._filtrados)} archivos)")
+        self.btn_anterior.config(state="normal" if self._pagina > 0 else "disabled")
+        self.btn_siguiente.config(state="normal" if self._pagina < paginas - 1 else "disabled")
+
+    def cargar_contenido(self, ventana, texto, lector, tamano_bloque, al_completar=None):
+        # Vuelca el archivo en el Text por trozos alineados a bloque, sin bloquear la interfaz
+        marco = tk.Frame(ventana)
+        marco.pack(fill="x", padx=10)
+        progreso = ttk.Progressbar(marco, maximum=max(lector.tamano, 1))
+        progreso.pack(side="left", expand=True, fill="x")
+        estado = tk.Label(marco, text="Cargando...")
+        estado.pack(side="left", padx=5)
+        trozo = max(1, TROZO_LECTURA // tamano_bloque) * tamano_bloque
+        def cancelar():
+            lector.close()
+            estado.config(text="Cancelado")
+            boton.config(state="disabled")
+        boton = tk.Button(marco, text="Cancelar", command=cancelar)
+        boton.pack(side="left")
+        def fallo(error):
+            if not lector.cerrado:
+                lector.close()
+                self.mostrar_error(error)
+        def recibir(parte):
+            if lector.cerrado:
+                return
+            if not parte:
+                lector.close()
+                estado.config(text="Completo")
+                boton.config(state="disabled")
+                if al_completar is not None:
+                    al_completar()
+                return
+            previo = texto.cget("state")
+            texto.configure(state="normal")
+            texto.insert(tk.END, parte)
+            texto.configure(state=previo)
+            progreso["value"] = lector.tell()
+            estado.config(text=f"{lector.tell()}/{lector.tamano}")
+            self.ejecutar(lambda: lector.read(trozo), recibir, fallo)
+        ventana.bind("<Destroy>", lambda evento: lector.close() if evento.widget is ventana else None)
+        self.ejecutar(lambda: lector.read(trozo), recibir, fallo)
 
     def ventana_crear(self):
         if "crear" not in self.acciones and "escribir" not in self.acciones:
@@ -107,14 +293,17 @@ class InterfazFAT:
             if not nombre:
                 messagebox.showerror("Error", "Ingresa un nombre válido.")
                 return
-            try:
-                self.fat.crear_archivo(nombre, contenido, self.rol, [])
+            def creado(_):
                 messagebox.showinfo("Éxito", f"Archivo '{nombre}' creado correctamente.")
                 top.destroy()
                 self.actualizar_lista()
-            except ValueError as e:
-                messagebox.showerror("Error", str(e))
-        tk.Button(top, text="Guardar", command=guardar).pack(pady=10)
+            def fallo(error):
+                boton.config(state="normal")
+                self.mostrar_error(error)
+            boton.config(state="disabled")
+            self.ejecutar(lambda: self.fat.crear_archivo(nombre, contenido, self.rol, []), creado, fallo)
+        boton = tk.Button(top, text="Guardar", command=guardar)
+        boton.pack(pady=10)
 
     def abrir_archivo(self):
         if "leer" not in self.acciones:
@@ -124,22 +313,22 @@ class InterfazFAT:
         if not seleccionado:
             messagebox.showerror("Error", "Selecciona un archivo para abrir.")
             return
-        try:
-            contenido = self.fat.leer_archivo(seleccionado, self.rol)
-            meta = self.fat.obtener_metadatos(seleccionado)
-        except (PermissionError, FileNotFoundError) as e:
-            messagebox.showerror("Error", str(e))
-            return
+        def abrir():
+            return self.fat.abrir_lectura(seleccionado, self.rol), self.fat.obtener_metadatos(seleccionado)
+        self.ejecutar(abrir, lambda resultado: self.mostrar_contenido(seleccionado, *resultado))
+
+    def mostrar_contenido(self, seleccionado, lector, meta):
         ventana = tk.Toplevel()
         ventana.title(f"Contenido - {seleccionado}")
-        ventana.geometry("600x450")
-        texto = tk.Text(ventana, wrap="word")
-        texto.insert("1.0", contenido)
-        texto.configure(state="disabled")
+        ventana.geometry("600x480")
+        texto = tk.Text(ventana, wrap="word", state="disabled")
         texto.pack(expand=True, fill="both", padx=10, pady=10)
+        self.cargar_contenido(ventana, texto, lector, meta.get("tamano_bloque", TAMANO_BLOQUE))
         info = (
             f"Nombre: {meta['nombre']}\n"
             f"Tamaño: {meta['tamaño']} bytes\n"
+            f"En disco: {meta.get('tamaño_fisico', meta['tamaño'])} bytes "
+            f"({meta.get('codec') or 'sin compresión'})\n"
             f"Owner: {meta['owner']}\n"
             f"Creado: {meta['fecha_creacion']}\n"
             f"Ult. Modif.: {meta['fecha_modificacion']}\n"
@@ -155,28 +344,36 @@ class InterfazFAT:
         if not seleccionado:
             messagebox.showerror("Error", "Selecciona un archivo para modificar.")
             return
-        try:
-            contenido_actual = self.fat.leer_archivo(seleccionado, self.rol)
-        except Exception as e:
-            messagebox.showerror("Error", str(e))
-            return
+        def abrir():
+            return self.fat.abrir_lectura(seleccionado, self.rol), self.fat.obtener_metadatos(seleccionado)
+        self.ejecutar(abrir, lambda resultado: self.editar_contenido(seleccionado, *resultado))
+
+    def editar_contenido(self, seleccionado, lector, meta):
         top = tk.Toplevel(self.master)
         top.title(f"Modificar - {seleccionado}")
-        top.geometry("520x420")
+        top.geometry("520x460")
         tk.Label(top, text=f"Modificando: {seleccionado}", font=("Arial", 12, "bold")).pack(pady=6)
-        texto = tk.Text(top, height=18, width=60)
-        texto.insert("1.0", contenido_actual)
+        texto = tk.Text(top, height=18, width=60, state="disabled")
         texto.pack(padx=10, pady=6)
         def guardar_modificacion():
             nuevo_contenido = texto.get("1.0", tk.END).rstrip("\n")
-            try:
-                self.fat.modificar_archivo(seleccionado, nuevo_contenido, self.rol)
+            def modificado(_):
                 messagebox.showinfo("Éxito", "Archivo modificado correctamente.")
                 top.destroy()
                 self.actualizar_lista()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
-        tk.Button(top, text="Guardar cambios", command=guardar_modificacion).pack(pady=8)
+            def fallo(error):
+                boton.config(state="normal")
+                self.mostrar_error(error)
+            boton.config(state="disabled")
+            self.ejecutar(lambda: self.fat.modificar_archivo(seleccionado, nuevo_contenido, self.rol),
+                          modificado, fallo)
+        # hasta tener el contenido completo no se puede guardar, o se truncaría el archivo
+        boton = tk.Button(top, text="Guardar cambios", command=guardar_modificacion, state="disabled")
+        def cargado():
+            texto.configure(state="normal")
+            boton.config(state="normal")
+        self.cargar_contenido(top, texto, lector, meta.get("tamano_bloque", TAMANO_BLOQUE), cargado)
+        boton.pack(pady=8)
 
     def eliminar_archivo(self):
         if "eliminar" not in self.acciones:
@@ -188,12 +385,10 @@ class InterfazFAT:
             return
         confirm = messagebox.askyesno("Confirmar", f"¿Mover '{seleccionado}' a papelera?")
         if confirm:
-            try:
-                self.fat.eliminar_archivo(seleccionado)
+            def eliminado(_):
                 messagebox.showinfo("Éxito", f"Archivo '{seleccionado}' movido a papelera.")
                 self.actualizar_lista()
-            except Exception as e:
-                messagebox.showerror("Error", str(e))
+            self.ejecutar(lambda: self.fat.eliminar_archivo(seleccionado), eliminado)
 
     def ver_papelera(self):
         top = tk.Toplevel(self.master)
@@ -202,10 +397,12 @@ class InterfazFAT:
         tk.Label(top, text="Archivos en papelera", font=("Arial", 12, "bold")).pack(pady=8)
         lista_papelera = tk.Listbox(top, width=100, height=15)
         lista_papelera.pack(pady=10)
-        archivos_papelera = self.fat.obtener_datos_papelera()
-        if not archivos_papelera:
-            lista_papelera.insert(tk.END, "No hay archivos en la papelera.")
-        else:
+        lista_papelera.insert(tk.END, "Cargando...")
+        def llenar(archivos_papelera):
+            lista_papelera.delete(0, tk.END)
+            if not archivos_papelera:
+                lista_papelera.insert(tk.END, "No hay archivos en la papelera.")
+                return
             for archivo in archivos_papelera:
                 info = (
                     f"Nombre: {archivo['nombre']} | "
@@ -214,24 +411,26 @@ class InterfazFAT:
                     f"Owner: {archivo.get('owner')}"
                 )
                 lista_papelera.insert(tk.END, info)
+        self.ejecutar(self.fat.obtener_datos_papelera, llenar)
         def recuperar_sel():
             sel = lista_papelera.curselection()
-            if not sel:
+            if not sel or not lista_papelera.get(sel[0]).startswith("Nombre:"):
                 messagebox.showerror("Error", "Selecciona un archivo para recuperar.")
                 return
             linea = lista_papelera.get(sel[0])
             nombre = linea.split("|")[0].replace("Nombre:", "").strip()
-            meta = self.fat.obtener_metadatos(nombre)
-            if meta is None:
-                messagebox.showerror("Error", "No se encontró el archivo.")
-                return
-            if meta.get("owner") != self.rol and "eliminar" not in self.acciones:
-                messagebox.showerror("Permiso denegado", "No tienes permiso para recuperar este archivo.")
-                return
-            self.fat.recuperar_archivo(nombre)
-            messagebox.showinfo("Éxito", f"Archivo '{nombre}' recuperado.")
-            top.destroy()
-            self.actualizar_lista()
+            def recuperar():
+                meta = self.fat.obtener_metadatos(nombre)
+                if meta is None:
+                    raise FileNotFoundError("No se encontró el archivo.")
+                if meta.get("owner") != self.rol and "eliminar" not in self.acciones:
+                    raise PermissionError("No tienes permiso para recuperar este archivo.")
+                self.fat.recuperar_archivo(nombre)
+            def recuperado(_):
+                messagebox.showinfo("Éxito", f"Archivo '{nombre}' recuperado.")
+                top.destroy()
+                self.actualizar_lista()
+            self.ejecutar(recuperar, recuperado)
         tk.Button(top, text="Recuperar seleccionado", command=recuperar_sel).pack(pady=6)
 
     def ventana_asignar(self):
@@ -239,7 +438,10 @@ class InterfazFAT:
         if not seleccionado:
             messagebox.showerror("Error", "Selecciona un archivo para asignar permisos.")
             return
-        meta = self.fat.obtener_metadatos(seleccionado)
+        self.ejecutar(lambda: self.fat.obtener_metadatos(seleccionado),
+                      lambda meta: self.mostrar_asignar(seleccionado, meta))
+
+    def mostrar_asignar(self, seleccionado, meta):
         if not meta:
             messagebox.showerror("Error", "No se encontró el archivo.")
             return
@@ -265,14 +467,44 @@ class InterfazFAT:
                 permisos_nuevos.append("leer")
             if var_escribir.get():
                 permisos_nuevos.append("escribir")
-            ok, msg = self.fat.asignar_permisos(seleccionado, self.rol, rol_obj, permisos_nuevos)
-            if ok:
-                messagebox.showinfo("Éxito", msg)
-                top.destroy()
-            else:
-                messagebox.showerror("Error", msg)
+            def aplicado(resultado):
+                ok, msg = resultado
+                if ok:
+                    messagebox.showinfo("Éxito", msg)
+                    top.destroy()
+                else:
+                    messagebox.showerror("Error", msg)
+            self.ejecutar(lambda: self.fat.asignar_permisos(seleccionado, self.rol, rol_obj, permisos_nuevos),
+                          aplicado)
         tk.Button(top, text="Aplicar permisos", command=aplicar).pack(pady=12)
 
+    def ver_estadisticas(self):
+        top = tk.Toplevel(self.master)
+        top.title("Estadísticas de operaciones")
+        top.geometry("760x360")
+        texto = tk.Text(top, wrap="none", font=("Courier", 9))
+        texto.pack(expand=True, fill="both", padx=10, pady=10)
+        def refrescar():
+            if not top.winfo_exists():
+                return
+            estadisticas = self.fat.estadisticas()
+            lineas = [f"{'Operación':<24}{'Llamadas':>9}{'Media ms':>10}{'Máx ms':>10}"
+                      f"{'Bl. leídos':>11}{'Bl. escritos':>13}{'JSON':>7}{'Llam. FS':>9}"]
+            for nombre, op in sorted(estadisticas["operaciones"].items()):
+                media = op["segundos"] * 1000 / op["llamadas"] if op["llamadas"] else 0
+                lineas.append(f"{nombre:<24}{op['llamadas']:>9}{media:>10.2f}{op['max_ms']:>10.2f}"
+                              f"{op['bloques_leidos']:>11}{op['bloques_escritos']:>13}"
+                              f"{op['parseos_json']:>7}{op['llamadas_fs']:>9}")
+            cache = estadisticas["cache"]
+            lineas.append("")
+            lineas.append(f"Caché: {cache['aciertos']} aciertos, {cache['fallos']} fallos, {cache['entradas']} entradas")
+            texto.configure(state="normal")
+            texto.delete("1.0", tk.END)
+            texto.insert("1.0", "\n".join(lineas))
+            texto.configure(state="disabled")
+            top.after(1000, refrescar)
+        refrescar()
+
 if __name__ == "__main__":
     login = tk.Tk()
     app = LoginWindow(login)
@@ -0,0 +1,48 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fat_logic import FATManager
+
+
+class ReparacionTest(unittest.TestCase):
+    def setUp(self):
+        self._tmp = tempfile.TemporaryDirectory()
+        self.fat = FATManager(self._tmp.name, almacen="json")
+        self.fat.crear_archivo("a", "a" * 60, "admin", [])
+        self.fat.crear_archivo("x", "x" * 60, "admin", [])
+        # el primer bloque de x pasa a enlazar con la cadena de a
+        ref_a = self.fat._indice_bloques(self.fat.obtener_metadatos("a"))[1]
+        ref_x = self.fat.obtener_metadatos("x")["ruta_inicial"]
+        with open(ref_x, "r", encoding="utf-8") as f:
+            bloque = json.load(f)
+        bloque["siguiente"] = ref_a
+        with open(ref_x, "w", encoding="utf-8") as f:
+            json.dump(bloque, f)
+        informe = self.fat.verificar(reparar=True)
+        self.assertIn("x", informe["reparados"])
+
+    def tearDown(self):
+        self.fat.cerrar()
+        self._tmp.cleanup()
+
+    def test_anexar_tras_reparar(self):
+        contenido = self.fat.leer_archivo("x", "admin")
+        self.fat.anexar("x", "y" * 45, "admin")
+        self.assertEqual(self.fat.leer_archivo("x", "admin"), contenido + "y" * 45)
+        self.assertEqual(self.fat.leer_archivo("a", "admin"), "a" * 60)
+        self.assertTrue(self.fat.verificar()["correcto"])
+
+    def test_modificar_tras_reparar(self):
+        self.fat.modificar_archivo("x", "z" * 130, "admin")
+        self.assertEqual(self.fat.leer_archivo("x", "admin"), "z" * 130)
+        self.assertEqual(self.fat.leer_archivo("a", "admin"), "a" * 60)
+        self.assertTrue(self.fat.verificar()["correcto"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, List, Optional, Tuple
+
+from almacen_bloques import clave_contenido, crear_almacen
+from compresion import descomprimir
+
+_almacen = None
+
+
+def _iniciar_proceso(tipo: str, data_dir: str):
+    global _almacen
+    _almacen = crear_almacen(tipo, data_dir)
+    _almacen.verificar = True
+
+
+def _decodificar(bloque: dict) -> Optional[str]:
+    try:
+        return descomprimir(bloque.get("datos", ""))
+    except Exception:
+        return None
+
+
+def revisar_archivo(almacen, nombre: str, inicial, bloques: Optional[list], hashes: Optional[list]) -> tuple:
+    # devuelve (nombre, refs alcanzadas, problema, ref del problema, refs dañadas, caracteres legibles)
+    refs, danados, real = [], [], 0
+    if bloques is not None:
+        for ref, clave in zip(bloques, hashes):
+            bloque = almacen.leer_bloque(ref)
+            if bloque is None:
+                return nombre, refs, "roto", ref, danados, real
+            refs.append(ref)
+            datos = _decodificar(bloque)
+            if datos is None or bloque.get("danado") or clave_contenido(datos) != clave:
+                danados.append(ref)
+            real += len(datos or "")
+        return nombre, refs, None, None, danados, real
+    visitados = set()
+    ref = inicial
+    while True:
+        if ref in visitados:
+            return nombre, refs, "ciclo", ref, danados, real
+        bloque = almacen.leer_bloque(ref)
+        if bloque is None:
+            return nombre, refs, "roto", ref, danados, real
+        visitados.add(ref)
+        refs.append(ref)
+        datos = _decodificar(bloque)
+        if datos is None or bloque.get("danado"):
+            danados.append(ref)
+        real += len(datos or "")
+        if bloque.get("eof", False):
+            return nombre, refs, None, None, danados, real
+        ref = bloque.get("siguiente")
+        if ref is None:
+            return nombre, refs, "roto", refs[-1], danados, real
+
+
+def _revisar_tanda(trabajos: List[tuple]) -> List[tuple]:
+    return [revisar_archivo(_almacen, *trabajo) for trabajo in trabajos]
+
+
+def recorrer_cadenas(tipo: str, data_dir: str, trabajos: List[tuple], procesos: Optional[int] = None) -> List[tuple]:
+    procesos = procesos or os.cpu_count() or 1
+    tamano_tanda = max(1, -(-len(trabajos) // (procesos * 4)))
+    tandas = [trabajos[i:i + tamano_tanda] for i in range(0, len(trabajos), tamano_tanda)]
+    with ProcessPoolExecutor(max_workers=procesos, initializer=_iniciar_proceso,
+                             initargs=(tipo, data_dir)) as pool:
+        return [resultado for tanda in pool.map(_revisar_tanda, tandas) for resultado in tanda]
+
+
+def agrupar_cruces(duenos: Iterable[Tuple[object, object]]) -> dict:
+    # ref -> dueños, solo para las refs con más de un dueño
+    primero = {}
+    cruces = {}
+    for ref, dueno in duenos:
+        previo = primero.setdefault(ref, dueno)
+        if previo != dueno:
+            cruces.setdefault(ref, {previo}).add(dueno)
+    return cruces